@@ -4,10 +4,131 @@ import hashlib
 import uuid
 from datetime import datetime
 import argparse
+import base64
 import getpass
 import difflib
+import gzip
+import io
+import json
 import tempfile
-from itertools import zip_longest
+import heapq
+import math
+import mmap
+import shutil
+import struct
+import zlib
+from bisect import bisect_right
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+from html import escape
+from itertools import accumulate, chain, zip_longest
+from operator import itemgetter
+
+# NumPy is only needed by the columnar engine; pyarrow speeds up its parsing when available and writes Parquet output
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pa_parquet
+except ImportError:
+    pa = pa_csv = pa_parquet = None
+# xxhash provides the optional xxh64 row fingerprint
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+# resource reports the open-file limit on Unix; it does not exist on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+from concurrent.futures import ProcessPoolExecutor
+
+# Default amount of memory a single sort may use before spilling a run to disk
+DEFAULT_MEMORY_LIMIT = "512M"
+# Default number of worker processes
+DEFAULT_JOBS = os.cpu_count() or 1
+# Default total size of the sorted runs kept in an index cache folder
+DEFAULT_INDEX_CACHE_SIZE = "4G"
+# Comparison engines: global sort and merge, hash partitioning with a dict join per bucket,
+# or vectorized NumPy arrays held in memory
+ENGINES = ("sort", "hash", "columnar")
+# Bytes of input parsed by pyarrow per chunk in the columnar engine
+COLUMNAR_BLOCK_SIZE = 64 * 1024 * 1024
+# Rows per chunk when the columnar engine parses with the csv module
+COLUMNAR_CHUNK_ROWS = 1000000
+# Constants of the 64-bit row hash used by the columnar engine (FNV-1a offset basis and prime)
+COLUMNAR_HASH_SEED = 0xcbf29ce484222325
+COLUMNAR_HASH_PRIME = 0x100000001b3
+# Separator between key columns in the columnar engine's key arrays
+COLUMNAR_KEY_SEPARATOR = b'\x01'
+# Result categories streamed to spill files by SpillSink
+SPILL_CATEGORIES = ("differences", "pre_only", "post_only", "matching")
+# Number of compared lines between progress messages
+PROGRESS_INTERVAL = 1000000
+# Report layouts: one self-contained HTML page, or an index page that loads compressed data shards while scrolling
+REPORT_MODES = ("html", "paged")
+# Number of table rows stored in each data shard of a paged report
+REPORT_SHARD_ROWS = 5000
+# Machine-readable output formats the results can be streamed to, next to or instead of the HTML report
+OUTPUT_FORMATS = ("jsonl", "csv", "parquet")
+# Fields of an output record and whether each holds text or a list of row fields
+OUTPUT_FIELDS = (("record_type", "text"), ("key", "text"), ("column_name", "text"), ("pre_value", "text"),
+                 ("post_value", "text"), ("row", "list"))
+# Number of records buffered per Parquet row group
+OUTPUT_BATCH_ROWS = 65536
+# Values longer than this many characters are highlighted whole instead of diffed character by character
+HIGHLIGHT_MAX_LENGTH = 1000
+# Number of highlighted (pre, post) value pairs remembered, so repeated pairs are only diffed once.
+# Only values up to HIGHLIGHT_MAX_LENGTH are cached, which bounds each entry to a few tens of KB.
+HIGHLIGHT_CACHE_SIZE = 4096
+# Where changed values are highlighted: while writing the report, or by the report page for the rows shown
+HIGHLIGHT_MODES = ("python", "browser")
+# Number of keys sampled from each file by the estimate mode, which fixes its memory use
+ESTIMATE_SAMPLE_SIZE = 65536
+# Categories of sampled keys reported by the estimate mode
+ESTIMATE_CATEGORIES = ("matching", "changed", "pre_only", "post_only")
+# Average number of rows per block of a Merkle tree; blocks end where a row hash has its low bits clear
+MERKLE_BLOCK_ROWS = 1024
+# Average number of children per node of a Merkle tree
+MERKLE_FANOUT = 16
+# Suffix of the Merkle tree files saved next to the input files
+MERKLE_TREE_SUFFIX = ".merkle.json"
+# Height in pixels of one table row in a paged report, whose rows are positioned from their index
+PAGED_REPORT_ROW_HEIGHT = 32
+# Maximum height in pixels of the scrolling area of a paged report section. Browsers clamp taller elements (near 17.9M
+# pixels in Firefox), so a section with more rows maps its scroll position to row indexes proportionally
+PAGED_REPORT_MAX_HEIGHT = 10_000_000
+# Maximum number of sorted runs merged in one pass
+MAX_MERGE_FANIN = 64
+# Number of bucket files a process keeps open when the open-file limit is unknown (on Windows, or when unlimited)
+DEFAULT_OPEN_BUCKETS = 256
+# Unquoted files at least this large are split into byte ranges that are parsed by several worker processes
+PARALLEL_PARSE_MIN_SIZE = 64 * 1024 * 1024
+# Approximate memory held by the (key, record) tuple and bytes objects of one buffered row
+RECORD_OVERHEAD = 150
+# Block size used when reading input files
+CHECKSUM_BLOCK_SIZE = 1024 * 1024
+# Number and size of the blocks, spread over two files of the same size, compared before their full contents
+IDENTICAL_SAMPLE_BLOCKS = 16
+IDENTICAL_SAMPLE_SIZE = 64 * 1024
+# Size of the sample checked for quoting before a file is split as bytes
+TOKENIZER_SAMPLE_SIZE = 1024 * 1024
+QUOTE = b'"'
+# Bytes stripped from ASCII key fields, the same characters str.strip() removes
+ASCII_WHITESPACE = b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f'
+# Header of a binary temp record: key length, field count, field data length and row digest length
+RECORD_HEADER = struct.Struct('<IIIB')
+# Row fingerprints: 8-byte blake2b or xxh64 for change detection, or SHA-256 for strict mode
+FINGERPRINTS = ("blake2b", "xxh64", "sha256")
+DEFAULT_FINGERPRINT = "blake2b"
+# Separator between key columns in the key bytes of a temp record
+KEY_SEPARATOR = b'\x00'
+# Orders the key columns of presorted files can be in: UTF-8 text order, or numeric order (e.g. ORDER BY an integer)
+KEY_ORDERS = ("text", "numeric")
 
 # Function to compute file checksum
 def compute_checksum(file_path, hash_type="sha256"):
@@ -26,112 +147,1364 @@ def determine_delimiter(file_path):
     else:
         raise ValueError(f"Unsupported file format for: {file_path}")
 
-# Function to compute a hash for a row
-def compute_row_hash(row):
-    row_str = '|'.join(row).encode('utf-8')
-    return hashlib.sha256(row_str).hexdigest()
+# Function to compute a hash for a row of UTF-8 encoded fields, as raw digest bytes
+def compute_row_hash(row, fingerprint=DEFAULT_FINGERPRINT):
+    row_str = b'|'.join(row)
+    if fingerprint == "blake2b":
+        return hashlib.blake2b(row_str, digest_size=8).digest()
+    if fingerprint == "xxh64":
+        return xxhash.xxh64_digest(row_str)
+    return hashlib.sha256(row_str).digest()
+
+# Function to check that a fingerprint can be used before any file is read
+def check_fingerprint(fingerprint):
+    if fingerprint not in FINGERPRINTS:
+        raise ValueError(f"Unsupported fingerprint: {fingerprint}. Use one of {', '.join(FINGERPRINTS)}.")
+    if fingerprint == "xxh64" and xxhash is None:
+        raise ImportError("The xxh64 fingerprint needs the xxhash package (pip install xxhash)")
+
+# Raw reader that feeds every byte it reads to a checksum, so a file is hashed while it is parsed
+class ChecksumReader(io.RawIOBase):
+    def __init__(self, file, checksum):
+        self.file = file
+        self.checksum = checksum
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.file.readinto(buffer)
+        if count:
+            self.checksum.update(memoryview(buffer)[:count])
+        return count
+
+    def drain(self):
+        # Hash anything the parser did not read, so the checksum always covers the whole file
+        while chunk := self.file.read(CHECKSUM_BLOCK_SIZE):
+            self.checksum.update(chunk)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+# Function to open a file for parsing; with a checksum object the bytes are hashed as they are read
+@contextmanager
+def open_input(file_path, checksum=None):
+    if checksum is None:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            yield file
+        return
+    reader = ChecksumReader(open(file_path, 'rb'), checksum)
+    with io.TextIOWrapper(io.BufferedReader(reader, CHECKSUM_BLOCK_SIZE), encoding='utf-8') as file:
+        yield file
+        reader.drain()
+
+# Function to check whether a file can be split as bytes: it is not empty and a sample from its start has no quotes
+def use_byte_tokenizer(file_path):
+    with open(file_path, 'rb') as file:
+        sample = file.read(TOKENIZER_SAMPLE_SIZE)
+    return bool(sample) and QUOTE not in sample
+
+# Generator to split the lines of a mapped file into fields as bytes, without decoding them.
+# A line holding a quote is parsed with csv instead, which reads on through line breaks inside quoted fields;
+# those line breaks are translated to \n as a text mode read would. Blank lines give empty rows, as with csv.reader.
+# When a checksum object is given it is updated with each block of lines read, so the mapping is walked once.
+def tokenize_bytes(records, delimiter, checksum=None):
+    separator = delimiter.encode('utf-8')
+    lines = iter(records.readline, b'')
+    hashed = 0
+    for line in lines:
+        if QUOTE in line:
+            texts = (text.decode('utf-8').replace('\r\n', '\n') for text in chain([line], lines))
+            row = [field.encode('utf-8') for field in next(csv.reader(texts, delimiter=delimiter))]
+        else:
+            row = split_line(line, separator)
+        if checksum is not None and records.tell() - hashed >= CHECKSUM_BLOCK_SIZE:
+            checksum.update(records[hashed:records.tell()])
+            hashed = records.tell()
+        yield row
+    if checksum is not None:
+        checksum.update(records[hashed:])
+
+# Function to split an unquoted line into fields as bytes; blank lines give an empty row, as with csv.reader
+def split_line(line, separator):
+    if line.endswith(b'\n'):
+        line = line[:-1]
+        if line.endswith(b'\r'):
+            line = line[:-1]
+    return line.split(separator) if line else []
+
+# Function to check whether a file can be parsed in byte ranges by several processes: it is large enough to be worth
+# it and a sample from its start has no quotes. Each range is checked for quotes as it is parsed, since a quoted
+# field could run across a range boundary.
+def can_split_ranges(file_path):
+    return os.path.getsize(file_path) >= PARALLEL_PARSE_MIN_SIZE and use_byte_tokenizer(file_path)
 
-# Generator to read rows from a file and compute their hashes
-def file_generator(file_path, delimiter, primary_key_cols):
-    with open(file_path, 'r', encoding='utf-8') as file:
+# Function to split the part of a file after its header into about `parts` byte ranges that end on line breaks
+def split_ranges(file_path, parts):
+    size = os.path.getsize(file_path)
+    ranges = []
+    with open(file_path, 'rb') as file:
+        file.readline()  # Skip the header
+        start = file.tell()
+        step = max((size - start) // parts, 1)
+        while start < size:
+            file.seek(min(start + step, size) - 1)
+            file.readline()
+            ranges.append((start, file.tell()))
+            start = file.tell()
+    return ranges
+
+# Function to strip a UTF-8 encoded field the way str.strip() would, decoding it only when it is not ASCII
+def strip_field(field):
+    if field.isascii():
+        return field.strip(ASCII_WHITESPACE)
+    return field.decode('utf-8').strip().encode('utf-8')
+
+# Generator to read rows from a file and compute their hashes.
+# Yields the key bytes (stripped key columns joined by a NUL byte), the UTF-8 encoded fields,
+# the row hash (None when no fingerprint is given) and the header. Files without quoting are split as bytes from a memory map;
+# others go through csv. When a checksum object is given it is updated with the file contents.
+def file_generator(file_path, delimiter, primary_key_cols, checksum=None, fingerprint=DEFAULT_FINGERPRINT):
+    key_width = max(primary_key_cols)
+    if use_byte_tokenizer(file_path):
+        with map_records(file_path) as records:
+            reader = tokenize_bytes(records, delimiter, checksum)
+            header = [field.decode('utf-8') for field in next(reader)]  # Read the header
+            for row in reader:
+                if len(row) > key_width:
+                    key = KEY_SEPARATOR.join(strip_field(row[i]) for i in primary_key_cols)
+                    yield key, row, compute_row_hash(row, fingerprint) if fingerprint else None, header
+        return
+    with open_input(file_path, checksum) as file:
         reader = csv.reader(file, delimiter=delimiter)
         header = next(reader)  # Read the header
         for row in reader:
-            if len(row) > max(primary_key_cols):
-                key = tuple(row[i].strip() for i in primary_key_cols)  # Use tuple for hashability
-                row_hash = compute_row_hash(row)
-                yield key, row, row_hash, header
-
-# Function to sort a file by primary key and write to a temporary file
-def sort_file_to_temp(file_path, delimiter, primary_key_cols):
-    temp_file = tempfile.NamedTemporaryFile(mode='w+', delete=False, encoding='utf-8')
+            if len(row) > key_width:
+                row = [field.encode('utf-8') for field in row]
+                key = KEY_SEPARATOR.join(strip_field(row[i]) for i in primary_key_cols)
+                yield key, row, compute_row_hash(row, fingerprint) if fingerprint else None, header
+
+# Function to count the rows of a file that take part in the comparison, without hashing them
+def count_rows(file_path, delimiter, primary_key_cols):
+    with open_input(file_path) as file:
+        reader = csv.reader(file, delimiter=delimiter)
+        next(reader)  # Skip the header
+        key_width = max(primary_key_cols)
+        return sum(1 for row in reader if len(row) > key_width)
+
+# Function to parse a human readable size such as 512M or 2G into bytes
+def parse_size(size):
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    text = str(size).strip().upper().rstrip("B")
+    try:
+        if text and text[-1] in units:
+            return int(float(text[:-1]) * units[text[-1]])
+        return int(text)
+    except ValueError:
+        raise ValueError(f"Invalid size: {size}") from None
+
+# Function to encode a row of UTF-8 encoded fields as a binary temp record, returns the key bytes and the record.
+# Record layout: header (key length, field count, data length, digest length), key bytes, row digest,
+# little-endian field end offsets and the concatenated field data.
+# Key columns are joined by a NUL byte, so comparing key bytes gives the same order as comparing key tuples.
+def encode_record(key_bytes, fields, row_hash):
+    data = b''.join(fields)
+    offsets = struct.pack(f'<{len(fields)}I', *accumulate(map(len, fields)))
+    header = RECORD_HEADER.pack(len(key_bytes), len(fields), len(data), len(row_hash))
+    return key_bytes, b''.join((header, key_bytes, row_hash, offsets, data))
+
+# Generator to walk the records of a mapped temp file, or of the part between two record positions, without
+# decoding them. Yields the key bytes, the row digest and the start and end position of each record.
+def iter_records(records, position=0, size=None):
+    if size is None:
+        size = len(records)
+    unpack_header = RECORD_HEADER.unpack_from
+    header_size = RECORD_HEADER.size
+    while position < size:
+        key_length, field_count, data_length, digest_length = unpack_header(records, position)
+        key_start = position + header_size
+        digest_start = key_start + key_length
+        digest_end = digest_start + digest_length
+        end = digest_end + 4 * field_count + data_length
+        yield records[key_start:digest_start], records[digest_start:digest_end], position, end
+        position = end
+
+# Generator to walk the records of a mapped temp file as (key bytes, raw record) pairs
+def iter_raw_records(records):
+    for key, row_hash, start, end in iter_records(records):
+        yield key, records[start:end]
+
+# Function to decode the fields of the record starting at a position
+def read_fields(records, position):
+    key_length, field_count, data_length, digest_length = RECORD_HEADER.unpack_from(records, position)
+    offsets_start = position + RECORD_HEADER.size + key_length + digest_length
+    data_start = offsets_start + 4 * field_count
+    ends = struct.unpack_from(f'<{field_count}I', records, offsets_start)
+    fields = []
+    field_start = data_start
+    for field_end in ends:
+        fields.append(records[field_start:data_start + field_end].decode('utf-8'))
+        field_start = data_start + field_end
+    return fields
+
+# Function to turn a NUL-joined key (bytes or str) back into the joined primary key shown in the report
+def display_key(key):
+    if isinstance(key, bytes):
+        key = key.decode('utf-8')
+    return key.replace('\x00', '|')
+
+# Context manager to map a temp file of records read-only; empty files map to empty bytes
+@contextmanager
+def map_records(file_path):
+    with open(file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as records:
+            yield records
+
+# Function to write one sorted run to its own temporary file
+def write_sorted_run(data):
+    data.sort(key=itemgetter(0))
+    run_file = tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.run')
+    with run_file:
+        run_file.writelines(record for key, record in data)
+    return run_file.name
+
+# Function to k-way merge sorted run files into one file; with a tree builder, the Merkle tree of the merged
+# records is built as they are written
+def merge_sorted_runs(run_files, output_file, tree_builder=None):
+    try:
+        with ExitStack() as stack:
+            runs = [iter_raw_records(stack.enter_context(map_records(run_file))) for run_file in run_files]
+            merged = heapq.merge(*runs, key=itemgetter(0))
+            output_file.writelines(tree_builder.records(merged) if tree_builder else (record for key, record in merged))
+    finally:
+        for run_file in run_files:
+            os.unlink(run_file)
+
+# Function to merge sorted run files into one open file, in several passes if there are more runs
+# than can be opened at once. The run files are removed. A tree builder only sees the final pass.
+def merge_runs(run_files, output_file, tree_builder=None):
+    try:
+        while len(run_files) > MAX_MERGE_FANIN:
+            merged_runs = []
+            for i in range(0, len(run_files), MAX_MERGE_FANIN):
+                run_file = tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.run')
+                with run_file:
+                    merge_sorted_runs(run_files[i:i + MAX_MERGE_FANIN], run_file)
+                merged_runs.append(run_file.name)
+            run_files = merged_runs
+        merge_sorted_runs(run_files, output_file, tree_builder)
+    except BaseException:
+        for run_file in run_files:
+            if os.path.exists(run_file):
+                os.unlink(run_file)
+        raise
+
+# Function to merge sorted run files into a new temporary file, returns its path and size,
+# and with block_tree the Merkle tree of the merged file, built while it is written
+def merge_runs_to_temp(run_files, block_tree=False):
+    temp_file = tempfile.NamedTemporaryFile(mode='wb', delete=False)
+    tree_builder = BlockTreeBuilder() if block_tree else None
+    try:
+        merge_runs(run_files, temp_file, tree_builder)
+    except BaseException:
+        temp_file.close()
+        os.unlink(temp_file.name)
+        raise
+    size = temp_file.tell()
+    temp_file.close()
+    merged = {"path": temp_file.name, "size": size}
+    if tree_builder:
+        merged["tree"] = tree_builder.levels()
+    return merged
+
+# Function to parse, hash and sort one byte range of an unquoted file into sorted run files,
+# spilling a run whenever the memory limit is reached. Returns the run files and the number of rows,
+# or None when the range holds a quote, in which case its runs are removed and the file must be parsed whole.
+def sort_range_to_runs(file_path, delimiter, primary_key_cols, start, end, memory_limit=DEFAULT_MEMORY_LIMIT,
+                       fingerprint=DEFAULT_FINGERPRINT):
+    memory_limit = parse_size(memory_limit)
+    separator = delimiter.encode('utf-8')
+    key_width = max(primary_key_cols)
+    data = []
+    data_size = 0
+    rows = 0
+    run_files = []
+    try:
+        with map_records(file_path) as records:
+            records.seek(start)
+            while records.tell() < end:
+                line = records.readline()
+                if QUOTE in line:
+                    for run_file in run_files:
+                        os.unlink(run_file)
+                    return None
+                row = split_line(line, separator)
+                if len(row) > key_width:
+                    rows += 1
+                    key = KEY_SEPARATOR.join(strip_field(row[i]) for i in primary_key_cols)
+                    key_bytes, record = encode_record(key, row, compute_row_hash(row, fingerprint))
+                    data.append((key_bytes, record))
+                    data_size += len(key_bytes) + len(record) + RECORD_OVERHEAD
+                    if data_size >= memory_limit:
+                        run_files.append(write_sorted_run(data))
+                        data = []
+                        data_size = 0
+        if data:
+            run_files.append(write_sorted_run(data))
+    except BaseException:
+        for run_file in run_files:
+            os.unlink(run_file)
+        raise
+    return run_files, rows
+
+# Sort of one file on a process pool. Large unquoted files are split into byte ranges that the workers parse,
+# hash and sort into runs, which one worker then merges; rows with equal keys stay in file order because the
+# runs are merged in range order. Other files, and files with a quote in any range, are sorted whole by one worker.
+# A file parsed in ranges is read once, so its checksum is None unless with_checksum asks for a separate read
+# (the index cache keys its entries by checksum). With block_tree the Merkle tree is built while the file is written.
+class PoolSort:
+    def __init__(self, executor, file_path, delimiter, primary_key_cols, memory_limit, fingerprint, jobs, log=print,
+                 with_checksum=False, block_tree=False):
+        self.executor = executor
+        self.file_args = (file_path, delimiter, primary_key_cols, memory_limit, fingerprint, block_tree)
+        self.block_tree = block_tree
+        self.log = log
+        self.range_futures = []
+        self.checksum_future = None
+        if jobs > 1 and can_split_ranges(file_path):
+            ranges = split_ranges(file_path, jobs)
+            log(f"Parsing {file_path} in {len(ranges)} ranges... {datetime.now()}")
+            range_limit = max(parse_size(memory_limit) // len(ranges), 1)
+            self.range_futures = [executor.submit(sort_range_to_runs, file_path, delimiter, primary_key_cols, start, end,
+                                                  range_limit, fingerprint) for start, end in ranges]
+            if with_checksum:
+                self.checksum_future = executor.submit(compute_checksum, file_path)
+            self.future = None
+        else:
+            self.future = executor.submit(sort_file_to_temp, *self.file_args)
+
+    # Once every range is sorted, hand their runs to one worker to merge
+    def merge(self):
+        if self.future is not None:
+            return
+        results = []
+        for future in self.range_futures:
+            results.append(future.result())
+            if results[-1] is None:
+                break
+        if None in results:
+            self.log(f"{self.file_args[0]} holds quotes, sorting it whole... {datetime.now()}")
+            self.discard()
+            self.range_futures = []
+            if self.checksum_future is not None:
+                self.checksum_future.cancel()
+                self.checksum_future = None
+            self.future = self.executor.submit(sort_file_to_temp, *self.file_args)
+            return
+        self.rows = sum(rows for run_files, rows in results)
+        self.future = self.executor.submit(merge_runs_to_temp, [run_file for run_files, rows in results
+                                                                for run_file in run_files], self.block_tree)
+
+    # Returns the same temp file metadata as sort_file_to_temp
+    def result(self):
+        result = self.future.result()
+        if not self.range_futures:
+            return result
+        result.update(checksum=self.checksum_future.result() if self.checksum_future is not None else None,
+                      rows=self.rows, input_size=os.path.getsize(self.file_args[0]))
+        return result
+
+    # Remove whatever temp files the finished tasks left behind
+    def discard(self):
+        for future in self.range_futures:
+            if not future.cancel() and future.exception() is None and future.result() is not None:
+                for run_file in future.result()[0]:
+                    if os.path.exists(run_file):
+                        os.unlink(run_file)
+        if self.future is not None and not self.future.cancel() and self.future.exception() is None:
+            os.unlink(self.future.result()["path"])
+
+# Function to sort a file by primary key and write to a temporary file.
+# Rows are collected until the memory limit is reached, then sorted and spilled as a run;
+# the runs are merged at the end so memory use stays flat regardless of the input size.
+# The input checksum is computed in the same read. Returns the temp file metadata:
+# its path, the input checksum, the number of rows and the sizes of the input and temp files,
+# and with block_tree the Merkle tree of the sorted file, built while it is written.
+def sort_file_to_temp(file_path, delimiter, primary_key_cols, memory_limit=DEFAULT_MEMORY_LIMIT, fingerprint=DEFAULT_FINGERPRINT,
+                      block_tree=False):
+    memory_limit = parse_size(memory_limit)
+    checksum = hashlib.sha256()
+    temp_file = tempfile.NamedTemporaryFile(mode='wb', delete=False)
+    tree_builder = BlockTreeBuilder() if block_tree else None
     data = []
-    for key, row, row_hash, header in file_generator(file_path, delimiter, primary_key_cols):
-        data.append((key, row, row_hash))
-    # Sort by primary key
-    data.sort(key=lambda x: x[0])
-    # Write sorted data to temporary file
-    for key, row, row_hash in data:
-        temp_file.write(f"{'|'.join(key)}\t{','.join(row)}\t{row_hash}\n")
+    data_size = 0
+    rows = 0
+    run_files = []
+    try:
+        for key, row, row_hash, header in file_generator(file_path, delimiter, primary_key_cols, checksum, fingerprint):
+            rows += 1
+            key_bytes, record = encode_record(key, row, row_hash)
+            data.append((key_bytes, record))
+            data_size += len(key_bytes) + len(record) + RECORD_OVERHEAD
+            if data_size >= memory_limit:
+                run_files.append(write_sorted_run(data))
+                data = []
+                data_size = 0
+
+        if not run_files:
+            # Everything fit in memory, write the single run straight to the output
+            data.sort(key=itemgetter(0))
+            temp_file.writelines(tree_builder.records(data) if tree_builder else (record for key, record in data))
+        else:
+            if data:
+                run_files.append(write_sorted_run(data))
+            data = []
+            merge_runs(run_files, temp_file, tree_builder)
+    except BaseException:
+        temp_file.close()
+        os.unlink(temp_file.name)
+        for run_file in run_files:
+            if os.path.exists(run_file):
+                os.unlink(run_file)
+        raise
+    size = temp_file.tell()
     temp_file.close()
-    return temp_file.name
+    sorted_file = {
+        "path": temp_file.name,
+        "checksum": checksum.hexdigest(),
+        "rows": rows,
+        "size": size,
+        "input_size": os.path.getsize(file_path)
+    }
+    if tree_builder:
+        sorted_file["tree"] = tree_builder.levels()
+    return sorted_file
 
-# Function to compare two sorted files line by line
-def compare_sorted_files(pre_temp_file, post_temp_file, primary_key_cols):
-    differences = []
-    fully_matching_rows = 0
-    matching_data = []
-    pre_only_rows = []
-    post_only_rows = []
+# Sink that streams comparison results to JSON Lines spill files, one file per result category.
+# Each line is a JSON array starting with the NUL-joined key, which sorts the same way as the key bytes.
+# Matching rows are only written when keep_matching is set. A file is created on the first write to its category;
+# with empty_files, close() also creates the files of the categories never written, so the summary names every file.
+# Without it their names are None, which keeps the sinks of the many small buckets of the hash engine from leaving
+# empty files behind.
+class SpillSink:
+    def __init__(self, keep_matching=False, empty_files=True):
+        self.keep_matching = keep_matching
+        self.empty_files = empty_files
+        self.files = {}
+        self.counts = {category: 0 for category in SPILL_CATEGORIES if category != "matching" or keep_matching}
 
-    # Get total lines for progress tracking
-    total_lines = sum(1 for _ in open(pre_temp_file, 'r', encoding='utf-8')) + sum(1 for _ in open(post_temp_file, 'r', encoding='utf-8'))
-    processed_lines = 0
+    def open(self, category):
+        self.files[category] = tempfile.NamedTemporaryFile(mode='w', delete=False, encoding='utf-8',
+                                                           suffix=f'.{category}.jsonl')
+        return self.files[category]
 
-    with open(pre_temp_file, 'r', encoding='utf-8') as pre_file, open(post_temp_file, 'r', encoding='utf-8') as post_file:
-        pre_line = pre_file.readline()
-        post_line = post_file.readline()
-        while pre_line or post_line:
-            pre_key = pre_line.split('\t')[0] if pre_line else None
-            post_key = post_line.split('\t')[0] if post_line else None
-
-            if pre_key == post_key:
-                # Rows match, compare hashes
-                pre_row = pre_line.split('\t')[1].split(',')
-                post_row = post_line.split('\t')[1].split(',')
-                pre_hash = pre_line.split('\t')[2].strip()
-                post_hash = post_line.split('\t')[2].strip()
-
-                if pre_hash == post_hash:
-                    fully_matching_rows += 1
-                    matching_data.append({"primary_key": pre_key, "pre_row": pre_row, "post_row": post_row})
+    def write(self, category, record):
+        file = self.files.get(category) or self.open(category)
+        file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.counts[category] += 1
+
+    def difference(self, key, row_diff):
+        self.write("differences", [key.decode('utf-8'), row_diff])
+
+    def pre_only(self, key, row):
+        self.write("pre_only", [key.decode('utf-8'), row])
+
+    def post_only(self, key, row):
+        self.write("post_only", [key.decode('utf-8'), row])
+
+    def matching(self, key, pre_row, post_row):
+        self.write("matching", [key.decode('utf-8'), pre_row, post_row])
+
+    def close(self):
+        if self.empty_files:
+            for category in self.counts.keys() - self.files.keys():
+                self.open(category)
+        for file in self.files.values():
+            file.close()
+        names = {category: file.name for category, file in self.files.items()}
+        return {
+            "differences_file": names.get("differences"),
+            "pre_only_file": names.get("pre_only"),
+            "post_only_file": names.get("post_only"),
+            "matching_file": names.get("matching"),
+            "total_differences": self.counts["differences"],
+            "pre_only_rows": self.counts["pre_only"],
+            "post_only_rows": self.counts["post_only"]
+        }
+
+    def discard(self):
+        for file in self.files.values():
+            file.close()
+            os.unlink(file.name)
+
+# Generator to read back the records of a spill file
+def read_spill(spill_file):
+    with open(spill_file, 'r', encoding='utf-8') as file:
+        for line in file:
+            yield json.loads(line)
+
+# Function to remove the spill files listed in a summary
+def remove_spill_files(result):
+    for name in ("differences_file", "pre_only_file", "post_only_file", "matching_file"):
+        if result.get(name):
+            os.unlink(result[name])
+
+# Function to k-way merge key-ordered spill files into one open file, removing the inputs.
+# No more files are opened at once than the open-file limit allows; more spill files are merged in several passes.
+def merge_spill_files(spill_files, output_file):
+    fanin = min(MAX_MERGE_FANIN, open_bucket_limit())
+    while len(spill_files) > fanin:
+        merged_files = []
+        for i in range(0, len(spill_files), fanin):
+            merged_file = tempfile.NamedTemporaryFile(mode='w', delete=False, encoding='utf-8', suffix='.jsonl')
+            with merged_file:
+                merge_spill_files(spill_files[i:i + fanin], merged_file)
+            merged_files.append(merged_file.name)
+        spill_files = merged_files
+    try:
+        with ExitStack() as stack:
+            files = [stack.enter_context(open(spill_file, 'r', encoding='utf-8')) for spill_file in spill_files]
+            output_file.writelines(heapq.merge(*files, key=lambda line: json.loads(line)[0]))
+    finally:
+        for spill_file in spill_files:
+            os.unlink(spill_file)
+
+# Function to compare two rows with the same key column by column
+def compare_rows(pre_row, post_row, primary_key_cols):
+    row_diff = []
+    for i in range(len(pre_row)):
+        if pre_row[i].strip() != post_row[i].strip() and i not in primary_key_cols:
+            row_diff.append({
+                "column_name": f"Column {i}",
+                "pre_value": pre_row[i],
+                "post_value": post_row[i]
+            })
+    return row_diff
+
+# Function to merge two key-ordered record streams, sending only-rows and differences (and matching rows
+# when the sink keeps them) to the sink. Records are (key, row digest, handle, ...) tuples, ordered by their key;
+# record_key returns the key bytes handed to the sink. The fields functions turn a record into its row fields,
+# so fields are only decoded for rows that need them.
+# In strict mode rows with equal digests are also compared field by field before they count as matching.
+# Returns the number of fully matching rows.
+def merge_sorted_records(pre_records, post_records, pre_fields, post_fields, primary_key_cols, sink, strict=False, log=print,
+                         total_lines=None, record_key=itemgetter(0)):
+    fully_matching_rows = 0
+    processed_lines = 0
+    next_progress = PROGRESS_INTERVAL
+    pre_record = next(pre_records, None)
+    post_record = next(post_records, None)
+    while pre_record or post_record:
+        if post_record is None or (pre_record is not None and pre_record[0] < post_record[0]):
+            # Row only in pre file
+            sink.pre_only(record_key(pre_record), pre_fields(pre_record))
+            pre_record = next(pre_records, None)
+            processed_lines += 1
+        elif pre_record is None or post_record[0] < pre_record[0]:
+            # Row only in post file
+            sink.post_only(record_key(post_record), post_fields(post_record))
+            post_record = next(post_records, None)
+            processed_lines += 1
+        else:
+            # Rows match, compare hashes
+            if pre_record[1] == post_record[1] and (not strict or pre_fields(pre_record) == post_fields(post_record)):
+                fully_matching_rows += 1
+                if sink.keep_matching:
+                    sink.matching(record_key(pre_record), pre_fields(pre_record), post_fields(post_record))
+            else:
+                # Hashes differ, perform detailed comparison
+                row_diff = compare_rows(pre_fields(pre_record), post_fields(post_record), primary_key_cols)
+                if row_diff:
+                    sink.difference(record_key(pre_record), row_diff)
                 else:
-                    # Hashes differ, perform detailed comparison
-                    row_diff = []
-                    for i in range(len(pre_row)):
-                        if pre_row[i].strip() != post_row[i].strip() and i not in primary_key_cols:
-                            row_diff.append({
-                                "column_name": f"Column {i}",
-                                "pre_value": pre_row[i],
-                                "post_value": post_row[i]
-                            })
-                    if row_diff:
-                        differences.append({
-                            "primary_key": pre_key,
-                            "differences": row_diff
-                        })
-                pre_line = pre_file.readline()
-                post_line = post_file.readline()
-            elif pre_key < post_key or post_key is None:
-                # Row only in pre file
-                pre_only_rows.append((pre_key, pre_line.split('\t')[1].split(',')))
-                pre_line = pre_file.readline()
+                    # Values only differ in surrounding whitespace
+                    fully_matching_rows += 1
+                    if sink.keep_matching:
+                        sink.matching(record_key(pre_record), pre_fields(pre_record), post_fields(post_record))
+            pre_record = next(pre_records, None)
+            post_record = next(post_records, None)
+            processed_lines += 2
+
+        # Update progress
+        if processed_lines >= next_progress:  # Print progress every 1 million lines
+            if total_lines:
+                log(f"Processed {processed_lines} of {total_lines} lines ({processed_lines / total_lines:.1%})...")
             else:
-                # Row only in post file
-                post_only_rows.append((post_key, post_line.split('\t')[1].split(',')))
-                post_line = post_file.readline()
+                log(f"Processed {processed_lines} lines...")
+            next_progress += PROGRESS_INTERVAL
+    return fully_matching_rows
 
-            # Update progress
-            processed_lines += 1
-            if processed_lines % 1000000 == 0:  # Print progress every 1 million lines
-                print(f"Processed {processed_lines} of {total_lines} lines...")
+# Function to compare two sorted files record by record, given the metadata returned by sort_file_to_temp.
+# Only keys and digests are sliced out of the mapped files; fields are decoded for differing rows only.
+# Results are streamed to spill files, so memory use does not grow with the number of rows or differences.
+# In strict mode rows with equal digests are also compared field by field before they count as matching.
+# When both files come with a Merkle tree, blocks with the same digest in both are counted as matching without
+# being read, except in strict mode or when matching rows are kept.
+def compare_sorted_files(pre_sorted, post_sorted, primary_key_cols, log=print, keep_matching=False, strict=False):
+    sink = SpillSink(keep_matching)
+
+    # Row counts come from the sort stage, the temp files are not scanned for them
+    total_pre_rows = pre_sorted["rows"]
+    total_post_rows = post_sorted["rows"]
+
+    try:
+        with map_records(pre_sorted["path"]) as pre_map, map_records(post_sorted["path"]) as post_map:
+            pre_records = iter_records(pre_map)
+            post_records = iter_records(post_map)
+            matched_rows = 0
+            if pre_sorted.get("tree") and post_sorted.get("tree") and not keep_matching and not strict:
+                pre_blocks, post_blocks, matched_rows = diff_block_trees(pre_sorted["tree"], post_sorted["tree"])
+                log(f"Merkle trees matched {matched_rows} rows, comparing {len(pre_blocks)} pre and "
+                    f"{len(post_blocks)} post blocks")
+                pre_records = chain.from_iterable(iter_records(pre_map, *pre_sorted["tree"][0][index][3:])
+                                                  for index in pre_blocks)
+                post_records = chain.from_iterable(iter_records(post_map, *post_sorted["tree"][0][index][3:])
+                                                   for index in post_blocks)
+            fully_matching_rows = matched_rows + merge_sorted_records(
+                pre_records, post_records,
+                lambda record: read_fields(pre_map, record[2]),
+                lambda record: read_fields(post_map, record[2]),
+                primary_key_cols, sink, strict, log,
+                total_pre_rows + total_post_rows - 2 * matched_rows)
+    except BaseException:
+        sink.discard()
+        raise
 
     summary = {
-        "total_pre_rows": sum(1 for _ in open(pre_temp_file, 'r', encoding='utf-8')),
-        "total_post_rows": sum(1 for _ in open(post_temp_file, 'r', encoding='utf-8')),
+        "total_pre_rows": total_pre_rows,
+        "total_post_rows": total_post_rows,
         "fully_matching_rows": fully_matching_rows,
-        "pre_only_rows": len(pre_only_rows),
-        "post_only_rows": len(post_only_rows),
-        "differences": differences,
-        "pre_only_data": {key: row for key, row in pre_only_rows},
-        "post_only_data": {key: row for key, row in post_only_rows},
-        "errors": [],
-        "matching_data": matching_data
+        "errors": []
     }
+    summary.update(sink.close())
     return summary
 
-# Function to highlight differences
+# Builder of the Merkle tree of a sorted temp file, fed the records in file order as they are written.
+# The records are cut into blocks at content-defined points: after a row whose hash has its low bits clear
+# (about every MERKLE_BLOCK_ROWS rows), but never between rows with the same key. Nodes of each upper level group
+# about MERKLE_FANOUT nodes of the level below the same way, by their digests. An insert or change therefore only
+# moves the boundaries around it, and the unchanged blocks of two versions of a file get the same digests.
+# Each level is a list of (first key, digest, rows, start, end) tuples, start and end being record positions for
+# blocks and child indexes for nodes.
+class BlockTreeBuilder:
+    def __init__(self):
+        self.blocks = []
+        self.digest = None
+        self.first_key = self.previous_key = None
+        self.start = self.position = self.rows = 0
+        self.cut = False
+
+    def add(self, key, record):
+        if self.cut and key != self.previous_key:
+            self.close_block()
+        if self.first_key is None:
+            self.first_key = key
+            self.digest = hashlib.blake2b(digest_size=16, person=b'block')
+        self.digest.update(record)
+        self.rows += 1
+        self.position += len(record)
+        self.previous_key = key
+        key_length, field_count, data_length, digest_length = RECORD_HEADER.unpack_from(record)
+        hash_start = RECORD_HEADER.size + key_length
+        row_hash = record[hash_start:hash_start + min(digest_length, 4)]
+        self.cut = self.cut or int.from_bytes(row_hash, 'little') & (MERKLE_BLOCK_ROWS - 1) == 0
+
+    def close_block(self):
+        self.blocks.append((self.first_key, self.digest.digest(), self.rows, self.start, self.position))
+        self.first_key = None
+        self.start = self.position
+        self.rows = 0
+        self.cut = False
+
+    # Generator to pass (key bytes, record) pairs through as records, adding each one to the tree
+    def records(self, pairs):
+        for key, record in pairs:
+            self.add(key, record)
+            yield record
+
+    # Returns the levels of the tree, from the blocks up to the root
+    def levels(self):
+        if self.rows:
+            self.close_block()
+        return build_tree_levels(self.blocks)
+
+# Function to build the upper levels of a Merkle tree over its blocks, returns all the levels
+def build_tree_levels(blocks):
+    levels = [blocks]
+    fanout_mask = MERKLE_FANOUT - 1
+    while len(levels[-1]) > 1:
+        children = levels[-1]
+        nodes = []
+        start = 0
+        for index, child in enumerate(children, start=1):
+            if int.from_bytes(child[1][:4], 'little') & fanout_mask == 0 or index == len(children):
+                group = children[start:index]
+                digest = hashlib.blake2b(b''.join(node[1] for node in group), digest_size=16, person=b'node')
+                nodes.append((group[0][0], digest.digest(), sum(node[2] for node in group), start, index))
+                start = index
+        if len(nodes) == len(children):
+            # No child closed a group before the last one, make this level the root
+            group_digest = hashlib.blake2b(b''.join(node[1] for node in children), digest_size=16, person=b'node')
+            nodes = [(children[0][0], group_digest.digest(), sum(node[2] for node in children), 0, len(children))]
+        levels.append(nodes)
+    return levels
+
+# Function to build the Merkle tree of a sorted temp file that was written without one (a cached sorted run)
+def build_sorted_tree(sorted_path):
+    tree_builder = BlockTreeBuilder()
+    with map_records(sorted_path) as records:
+        for record in tree_builder.records(iter_raw_records(records)):
+            pass
+    return tree_builder.levels()
+
+# Function to find the blocks that differ between two Merkle trees from their digests alone, top down: nodes are
+# matched by digest level by level, and only the unmatched ones are opened, so the work grows with the number of
+# changed blocks and only logarithmically with the unchanged ones. Returns the indexes of the unmatched blocks of
+# each tree, in file order, and the number of rows in matched blocks.
+def diff_block_trees(pre_levels, post_levels):
+    pre_frontier = [(len(pre_levels) - 1, index) for index in range(len(pre_levels[-1]))]
+    post_frontier = [(len(post_levels) - 1, index) for index in range(len(post_levels[-1]))]
+    matched_rows = 0
+    while True:
+        # Match the nodes of both frontiers that have the same level and digest
+        post_nodes = {}
+        for level, index in post_frontier:
+            post_nodes.setdefault((level, post_levels[level][index][1]), []).append((level, index))
+        unmatched_pre = []
+        for level, index in pre_frontier:
+            candidates = post_nodes.get((level, pre_levels[level][index][1]))
+            if candidates:
+                candidates.pop()
+                matched_rows += pre_levels[level][index][2]
+            else:
+                unmatched_pre.append((level, index))
+        unmatched_post = [node for nodes in post_nodes.values() for node in nodes]
+        top = max((level for level, index in unmatched_pre + unmatched_post), default=0)
+        if top == 0:
+            return (sorted(index for level, index in unmatched_pre), sorted(index for level, index in unmatched_post),
+                    matched_rows)
+        # Open the highest unmatched nodes into their children
+        pre_frontier = [child for node in unmatched_pre for child in open_tree_node(pre_levels, node, top)]
+        post_frontier = [child for node in unmatched_post for child in open_tree_node(post_levels, node, top)]
+
+# Function to replace a tree node of the given level by its children, leaving nodes of lower levels as they are
+def open_tree_node(levels, node, top):
+    level, index = node
+    if level < top:
+        return [node]
+    first_key, digest, rows, start, end = levels[level][index]
+    return [(level - 1, child) for child in range(start, end)]
+
+# Function to save a Merkle tree next to its input file, with what is needed to compare it with the tree of another
+# copy: the key columns, the row fingerprint and the input checksum. Block positions are local and left out.
+def save_block_tree(levels, tree_path, primary_key_cols, fingerprint, checksum):
+    tree = {
+        "primary_key_cols": primary_key_cols,
+        "fingerprint": fingerprint,
+        "checksum": checksum,
+        "block_rows": MERKLE_BLOCK_ROWS,
+        "fanout": MERKLE_FANOUT,
+        "levels": [[[first_key.decode('utf-8'), digest.hex(), rows] + ([start, end] if level else [])
+                    for first_key, digest, rows, start, end in nodes] for level, nodes in enumerate(levels)]
+    }
+    with open(tree_path + ".tmp", 'w', encoding='utf-8') as tree_file:
+        json.dump(tree, tree_file, ensure_ascii=False)
+    os.replace(tree_path + ".tmp", tree_path)
+
+# Function to load a Merkle tree saved by save_block_tree, returns its settings and levels
+def load_block_tree(tree_path):
+    with open(tree_path, 'r', encoding='utf-8') as tree_file:
+        tree = json.load(tree_file)
+    tree["levels"] = [[(first_key.encode('utf-8'), bytes.fromhex(digest), rows, *(positions or (None, None)))
+                       for first_key, digest, rows, *positions in nodes] for nodes in tree["levels"]]
+    return tree
+
+# Function to list the key ranges whose blocks differ between two saved Merkle trees, without reading any rows.
+# Each range runs from the first key of a block to the first key of the next block of the same tree.
+def compare_block_tree_files(pre_tree_path, post_tree_path):
+    pre_tree = load_block_tree(pre_tree_path)
+    post_tree = load_block_tree(post_tree_path)
+    for setting in ("primary_key_cols", "fingerprint", "block_rows", "fanout"):
+        if pre_tree[setting] != post_tree[setting]:
+            raise ValueError(f"The Merkle trees were built with different {setting}: {pre_tree[setting]} and {post_tree[setting]}")
+    pre_blocks, post_blocks, matched_rows = diff_block_trees(pre_tree["levels"], post_tree["levels"])
+    ranges = []
+    for side, tree, indexes in (("pre", pre_tree, pre_blocks), ("post", post_tree, post_blocks)):
+        blocks = tree["levels"][0]
+        for index in indexes:
+            next_key = display_key(blocks[index + 1][0]) if index + 1 < len(blocks) else None
+            ranges.append({"file": side, "first_key": display_key(blocks[index][0]), "next_key": next_key,
+                           "rows": blocks[index][2]})
+    return {"ranges": ranges, "matched_rows": matched_rows, "pre_blocks": len(pre_tree["levels"][0]),
+            "post_blocks": len(post_tree["levels"][0]), "primary_key_cols": pre_tree["primary_key_cols"]}
+
+# Error raised when an input given as presorted is not sorted by its key columns
+class UnsortedInputError(ValueError):
+    pass
+
+# Function to parse a key order: one of KEY_ORDERS for every key column, or a comma-separated order per key column
+def parse_key_order(key_order, primary_key_cols):
+    orders = key_order.split(",")
+    if len(orders) == 1:
+        orders = orders * len(primary_key_cols)
+    if len(orders) != len(primary_key_cols) or any(order not in KEY_ORDERS for order in orders):
+        raise ValueError(f"Unknown key order: {key_order}, expected one of {', '.join(KEY_ORDERS)} "
+                         f"or one of them per key column")
+    return orders
+
+# Function to turn key bytes into a value that compares in the given key order: text columns compare as UTF-8 bytes
+# and numeric columns as numbers. Numerals of the same value written differently (1, 01, 1.0, 1_0 and 10) are
+# different keys to the other engines, so equal numbers are ordered by their bytes and never paired with each other.
+# Raises ValueError for a numeric column that is not a finite number.
+def order_key(key_bytes, orders):
+    values = []
+    for order, field in zip(orders, key_bytes.split(KEY_SEPARATOR)):
+        if order == "numeric":
+            try:
+                number = int(field)
+            except ValueError:
+                number = float(field)
+                if not math.isfinite(number):
+                    raise ValueError(f"{number} is not a finite number")
+            values.append((number, field))
+        else:
+            values.append(field)
+    return tuple(values)
+
+# Generator to stream the rows of a file that is already sorted by its key columns, checking the order as it goes.
+# In text order keys must be in ascending order of their NUL-joined UTF-8 bytes, the order the sort stage produces;
+# numeric key columns must be in ascending numeric order, with equal numbers in the order of their bytes.
+# Yields the order key, the row digest, the UTF-8 encoded fields and the key bytes of each row, and counts the rows
+# in stats.
+def iter_presorted(file_path, delimiter, primary_key_cols, checksum, stats, fingerprint=DEFAULT_FINGERPRINT,
+                   key_order=("text",)):
+    text_order = all(order == "text" for order in key_order)
+    order_name = key_order[0] if len(set(key_order)) == 1 else ",".join(key_order)
+    previous_key = previous_key_bytes = None
+    for key_bytes, row, row_hash, header in file_generator(file_path, delimiter, primary_key_cols, checksum, fingerprint):
+        if text_order:
+            key = key_bytes
+        else:
+            try:
+                key = order_key(key_bytes, key_order)
+            except ValueError:
+                raise UnsortedInputError(f"{file_path} is not sorted in numeric key order: key {display_key(key_bytes)} "
+                                         f"at row {stats['rows'] + 1} is not a number") from None
+        if previous_key is not None and key < previous_key:
+            raise UnsortedInputError(f"{file_path} is not sorted by its key columns in {order_name} order: "
+                                     f"key {display_key(key_bytes)} at row {stats['rows'] + 1} comes after "
+                                     f"{display_key(previous_key_bytes)}")
+        previous_key = key
+        previous_key_bytes = key_bytes
+        stats["rows"] += 1
+        yield key, row_hash, row, key_bytes
+
+# Function to decode the fields of a streamed record
+def decode_fields(record):
+    return [field.decode('utf-8') for field in record[2]]
+
+# Function to compare two files that are already sorted by their key columns in one streaming pass,
+# with no sort stage and no temp files. Raises UnsortedInputError on the first key out of order.
+# The key order (see parse_key_order) is used both to check the files and to merge them.
+# Returns the summary and the checksums of both inputs, computed in the same read.
+def compare_presorted_files(pre_file, post_file, primary_key_cols, log=print, keep_matching=False, strict=False,
+                            fingerprint=DEFAULT_FINGERPRINT, key_order="text"):
+    key_order = parse_key_order(key_order, primary_key_cols)
+    sink = SpillSink(keep_matching)
+    pre_checksum = hashlib.sha256()
+    post_checksum = hashlib.sha256()
+    pre_stats = {"rows": 0}
+    post_stats = {"rows": 0}
+    log(f"Comparing presorted files... {datetime.now()}")
+    try:
+        fully_matching_rows = merge_sorted_records(
+            iter_presorted(pre_file, determine_delimiter(pre_file), primary_key_cols, pre_checksum, pre_stats, fingerprint,
+                           key_order),
+            iter_presorted(post_file, determine_delimiter(post_file), primary_key_cols, post_checksum, post_stats, fingerprint,
+                           key_order),
+            decode_fields, decode_fields, primary_key_cols, sink, strict, log, record_key=itemgetter(3))
+    except BaseException:
+        sink.discard()
+        raise
+
+    summary = {
+        "total_pre_rows": pre_stats["rows"],
+        "total_post_rows": post_stats["rows"],
+        "fully_matching_rows": fully_matching_rows,
+        "errors": []
+    }
+    summary.update(sink.close())
+    return summary, pre_checksum.hexdigest(), post_checksum.hexdigest()
+
+# Function to choose the bucket of a key; must be stable across processes, so the built-in hash() is not used
+def partition_of(key_bytes, partitions):
+    return zlib.crc32(key_bytes) % partitions
+
+# Function to return how many bucket files one process may keep open: half of its open-file limit,
+# leaving the rest for the input, spill and library files
+def open_bucket_limit():
+    if resource is None:
+        return DEFAULT_OPEN_BUCKETS
+    soft_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    if soft_limit == resource.RLIM_INFINITY:
+        return DEFAULT_OPEN_BUCKETS
+    return max(soft_limit // 2, 2)
+
+# Function to write (key bytes, record) pairs to one bucket file per partition from first to last (exclusive).
+# With more partitions than files that may be open at once, the records are first split into groups of
+# consecutive partitions, one file per group, and each group file is split again the same way.
+# Records keep their file order in every bucket. Returns the bucket paths in partition order.
+def write_buckets(records, partitions, first, last, open_limit):
+    count = last - first
+    groups = count if count <= open_limit else min(open_limit, math.ceil(count / open_limit))
+    starts = [first + count * group // groups for group in range(groups)]
+    files = [tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.bucket') for _ in starts]
+    buckets = []
+    try:
+        try:
+            for key_bytes, record in records:
+                files[bisect_right(starts, partition_of(key_bytes, partitions)) - 1].write(record)
+        finally:
+            for file in files:
+                file.close()
+        if groups == count:
+            return [file.name for file in files]
+        for group, file in enumerate(files):
+            group_last = starts[group + 1] if group + 1 < groups else last
+            with map_records(file.name) as group_records:
+                buckets.extend(write_buckets(iter_raw_records(group_records), partitions, starts[group], group_last,
+                                             open_limit))
+            os.unlink(file.name)
+        return buckets
+    except BaseException:
+        for path in [file.name for file in files] + buckets:
+            if os.path.exists(path):
+                os.unlink(path)
+        raise
+
+# Function to split a file into on-disk buckets by a hash of the primary key.
+# The number of bucket files open at once is kept under the open-file limit (see write_buckets).
+# Returns the bucket paths and the checksum of the input, computed in the same read.
+def partition_file(file_path, delimiter, primary_key_cols, partitions, fingerprint=DEFAULT_FINGERPRINT):
+    checksum = hashlib.sha256()
+    records = (encode_record(key, row, row_hash)
+               for key, row, row_hash, header in file_generator(file_path, delimiter, primary_key_cols, checksum, fingerprint))
+    buckets = write_buckets(records, partitions, 0, partitions, open_bucket_limit())
+    return {"buckets": buckets, "checksum": checksum.hexdigest()}
+
+# Function to compare one pre/post bucket pair with an in-memory dict join.
+# Rows with the same key are paired in file order, like the merge join of the sort engine pairs them.
+# The bucket's results are sorted by key and written to its own spill files for the caller to merge;
+# a category without results gets no file.
+def compare_partition(pre_bucket, post_bucket, primary_key_cols, keep_matching=False, strict=False):
+    result = {
+        "total_pre_rows": 0,
+        "total_post_rows": 0,
+        "fully_matching_rows": 0
+    }
+    differences = []
+    post_only_rows = []
+    matching_data = []
+    sink = SpillSink(keep_matching, empty_files=False)
+    try:
+        with map_records(pre_bucket) as pre_map, map_records(post_bucket) as post_map:
+            pre_rows = {}
+            for key, row_hash, position, end in iter_records(pre_map):
+                result["total_pre_rows"] += 1
+                pre_rows.setdefault(key, []).append((row_hash, position))
+            # Reverse the rows of each key so pairing pops them in file order from the end
+            for entries in pre_rows.values():
+                entries.reverse()
+
+            for key, post_hash, post_position, end in iter_records(post_map):
+                result["total_post_rows"] += 1
+                entries = pre_rows.get(key)
+                if not entries:
+                    post_only_rows.append((key, read_fields(post_map, post_position)))
+                    continue
+                pre_hash, pre_position = entries.pop()
+                if not entries:
+                    del pre_rows[key]
+                if pre_hash == post_hash and (
+                        not strict or read_fields(pre_map, pre_position) == read_fields(post_map, post_position)):
+                    result["fully_matching_rows"] += 1
+                    if keep_matching:
+                        matching_data.append((key, read_fields(pre_map, pre_position), read_fields(post_map, post_position)))
+                else:
+                    row_diff = compare_rows(read_fields(pre_map, pre_position), read_fields(post_map, post_position),
+                                            primary_key_cols)
+                    if row_diff:
+                        differences.append((key, row_diff))
+                    else:
+                        # Values only differ in surrounding whitespace
+                        result["fully_matching_rows"] += 1
+                        if keep_matching:
+                            matching_data.append((key, read_fields(pre_map, pre_position),
+                                                  read_fields(post_map, post_position)))
+
+            for key, row_diff in sorted(differences, key=itemgetter(0)):
+                sink.difference(key, row_diff)
+            for key in sorted(pre_rows):
+                for row_hash, position in reversed(pre_rows[key]):
+                    sink.pre_only(key, read_fields(pre_map, position))
+            for key, row in sorted(post_only_rows, key=itemgetter(0)):
+                sink.post_only(key, row)
+            for key, pre_row, post_row in sorted(matching_data, key=itemgetter(0)):
+                sink.matching(key, pre_row, post_row)
+    except BaseException:
+        sink.discard()
+        raise
+
+    os.unlink(pre_bucket)
+    os.unlink(post_bucket)
+    result.update(sink.close())
+    return result
+
+# Function to pick the number of buckets so one bucket pair per worker fits in the memory limit
+def default_partitions(pre_file, memory_limit, jobs):
+    # A parsed row takes several times its size on disk once it is held in a dict
+    estimated_memory = 4 * os.path.getsize(pre_file) * max(jobs, 1)
+    return max(jobs * 4, math.ceil(estimated_memory / parse_size(memory_limit)))
+
+# Function to compare two files by hash partitioning both and joining the bucket pairs in a process pool.
+# Produces the same summary as compare_sorted_files, in the same key order, plus the checksums of both inputs.
+def compare_files_partitioned(pre_file, post_file, primary_key_cols, partitions=None, memory_limit=DEFAULT_MEMORY_LIMIT,
+                              jobs=DEFAULT_JOBS, log=print, keep_matching=False, fingerprint=DEFAULT_FINGERPRINT, strict=False):
+    if not partitions:
+        partitions = default_partitions(pre_file, memory_limit, jobs)
+    pre_args = (pre_file, determine_delimiter(pre_file), primary_key_cols, partitions, fingerprint)
+    post_args = (post_file, determine_delimiter(post_file), primary_key_cols, partitions, fingerprint)
+
+    with ProcessPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        log(f"Partitioning pre and post files into {partitions} buckets... {datetime.now()}")
+        pre_future = executor.submit(partition_file, *pre_args)
+        post_future = executor.submit(partition_file, *post_args)
+        errors = [future.exception() for future in (pre_future, post_future)]
+        if any(errors):
+            for future, error in zip((pre_future, post_future), errors):
+                if error is None:
+                    for bucket in future.result()["buckets"]:
+                        os.unlink(bucket)
+            raise next(error for error in errors if error)
+        pre_partitioned = pre_future.result()
+        post_partitioned = post_future.result()
+
+        log(f"Comparing buckets... {datetime.now()}")
+        futures = [executor.submit(compare_partition, pre_bucket, post_bucket, primary_key_cols, keep_matching, strict)
+                   for pre_bucket, post_bucket in zip(pre_partitioned["buckets"], post_partitioned["buckets"])]
+        results = []
+        for completed, future in enumerate(futures, start=1):
+            results.append(future.result())
+            if completed % 10 == 0 or completed == partitions:
+                log(f"Compared {completed} of {partitions} buckets...")
+
+    # Buckets come back in hash order, merge their spill files back into the primary key order of the sort engine;
+    # buckets without rows of a category have no spill file for it
+    summary = {
+        "total_pre_rows": sum(result["total_pre_rows"] for result in results),
+        "total_post_rows": sum(result["total_post_rows"] for result in results),
+        "fully_matching_rows": sum(result["fully_matching_rows"] for result in results),
+        "total_differences": sum(result["total_differences"] for result in results),
+        "pre_only_rows": sum(result["pre_only_rows"] for result in results),
+        "post_only_rows": sum(result["post_only_rows"] for result in results),
+        "matching_file": None,
+        "errors": []
+    }
+    for name in ("differences_file", "pre_only_file", "post_only_file", "matching_file"):
+        if keep_matching or name != "matching_file":
+            spill_file = tempfile.NamedTemporaryFile(mode='w', delete=False, encoding='utf-8', suffix='.jsonl')
+            with spill_file:
+                merge_spill_files([result[name] for result in results if result[name]], spill_file)
+            summary[name] = spill_file.name
+    return summary, pre_partitioned["checksum"], post_partitioned["checksum"]
+
+# Function to read a delimited file into one fixed-width bytes NumPy array per column, in large chunks.
+# pyarrow parses the file when it is installed, otherwise the csv module is used.
+# The checksum object is updated with the file contents in the same read.
+def read_columns(file_path, delimiter, checksum):
+    reader = ChecksumReader(open(file_path, 'rb'), checksum)
+    with io.BufferedReader(reader, CHECKSUM_BLOCK_SIZE) as file:
+        header = next(csv.reader([file.readline().decode('utf-8')], delimiter=delimiter), [])
+        column_count = len(header)
+        chunks = [[] for _ in range(column_count)]
+        # pyarrow rejects an empty stream, a header-only file goes through the csv module
+        if pa_csv is not None and file.peek(1):
+            column_names = [f"c{i}" for i in range(column_count)]
+            batches = pa_csv.open_csv(
+                file,
+                read_options=pa_csv.ReadOptions(column_names=column_names, block_size=COLUMNAR_BLOCK_SIZE),
+                parse_options=pa_csv.ParseOptions(delimiter=delimiter, newlines_in_values=True),
+                convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in column_names}))
+            for batch in batches:
+                for i in range(column_count):
+                    chunks[i].append(np.array(batch.column(i).cast(pa.binary()).to_numpy(zero_copy_only=False), dtype='S'))
+        else:
+            text = io.TextIOWrapper(file, encoding='utf-8')
+            rows = []
+            for row in csv.reader(text, delimiter=delimiter):
+                if not row:
+                    continue
+                if len(row) != column_count:
+                    raise ValueError(f"The columnar engine needs {column_count} fields on every row of {file_path}, "
+                                     f"found {len(row)}; use --engine sort for ragged files")
+                rows.append(row)
+                if len(rows) == COLUMNAR_CHUNK_ROWS:
+                    append_column_chunks(chunks, rows)
+                    rows = []
+            append_column_chunks(chunks, rows)
+            text.detach()
+        reader.drain()
+    return [np.concatenate(column) if column else np.array([], dtype='S1') for column in chunks]
+
+# Function to transpose a chunk of parsed rows onto the per-column chunk lists
+def append_column_chunks(chunks, rows):
+    if rows:
+        for i, values in enumerate(zip(*rows)):
+            chunks[i].append(np.array([value.encode('utf-8') for value in values], dtype='S'))
+
+# Function to compute a 64-bit hash of every row over fixed-width byte columns.
+# Each column is padded to the given width, viewed as 8-byte words and folded in with vectorized xor/multiply steps.
+# Both files must be hashed with the same widths, or the same values padded differently get different hashes.
+def hash_columns(columns, row_count, widths):
+    hashes = np.full(row_count, COLUMNAR_HASH_SEED, dtype=np.uint64)
+    for column, width in zip(columns, widths):
+        width = -(-width // 8) * 8
+        words = np.ascontiguousarray(column, dtype=f'S{width}').view('<u8').reshape(row_count, width // 8)
+        for j in range(words.shape[1]):
+            hashes ^= words[:, j]
+            hashes *= COLUMNAR_HASH_PRIME
+        # Mix between columns, so values cannot shift from one column into the next
+        hashes ^= hashes >> np.uint64(29)
+        hashes *= COLUMNAR_HASH_PRIME
+    return hashes
+
+# Function to build the joined, stripped primary key of every row as one bytes array.
+# NumPy drops trailing NUL bytes when concatenating, so the columns are joined by \x01 instead,
+# which sorts the same way for any key without control characters.
+def key_column(columns, primary_key_cols):
+    keys = np.char.strip(columns[primary_key_cols[0]])
+    for i in primary_key_cols[1:]:
+        keys = np.char.add(np.char.add(keys, COLUMNAR_KEY_SEPARATOR), np.char.strip(columns[i]))
+    return keys
+
+# Function to rebuild the NUL-joined key bytes of one row for the spill files
+def row_key(columns, primary_key_cols, index):
+    return KEY_SEPARATOR.join(columns[i][index].strip() for i in primary_key_cols)
+
+# Function to decode one row of the column arrays
+def row_values(columns, index):
+    return [column[index].decode('utf-8') for column in columns]
+
+# Function to compare two files with NumPy arrays instead of per-row Python work.
+# Rows are joined on their sorted key bytes (argsort/searchsorted), 64-bit row hashes pick out the changed rows,
+# and only those rows are compared column by column. Both files are held in memory.
+# In strict mode rows with equal hashes are also compared column by column before they count as matching.
+# Produces the same summary as compare_sorted_files, plus the checksums of both inputs.
+def compare_files_columnar(pre_file, post_file, primary_key_cols, log=print, keep_matching=False, strict=False):
+    if np is None:
+        raise ImportError("The columnar engine needs NumPy (pip install numpy); pyarrow is used for parsing when installed")
+    pre_checksum = hashlib.sha256()
+    post_checksum = hashlib.sha256()
+    log(f"Reading pre file into columns... {datetime.now()}")
+    pre_columns = read_columns(pre_file, determine_delimiter(pre_file), pre_checksum)
+    log(f"Reading post file into columns... {datetime.now()}")
+    post_columns = read_columns(post_file, determine_delimiter(post_file), post_checksum)
+    if len(pre_columns) != len(post_columns):
+        raise ValueError(f"The columnar engine needs the same columns in both files, found {len(pre_columns)} and {len(post_columns)}")
+    if max(primary_key_cols) >= len(pre_columns):
+        raise ValueError(f"Primary key column {max(primary_key_cols)} is out of range for {len(pre_columns)} columns")
+    total_pre_rows = len(pre_columns[0])
+    total_post_rows = len(post_columns[0])
+
+    log(f"Hashing and joining {total_pre_rows} pre rows and {total_post_rows} post rows... {datetime.now()}")
+    pre_keys = key_column(pre_columns, primary_key_cols)
+    post_keys = key_column(post_columns, primary_key_cols)
+    pre_order = np.argsort(pre_keys, kind='stable')
+    post_order = np.argsort(post_keys, kind='stable')
+    pre_sorted_keys = pre_keys[pre_order]
+    post_sorted_keys = post_keys[post_order]
+
+    # Sorted join: find each post key in the sorted pre keys. Rows with the same key are paired in file order
+    # (the sorts are stable), so the n-th post row of a key takes the n-th pre row of that key.
+    post_ranks = np.arange(total_post_rows) - np.searchsorted(post_sorted_keys, post_sorted_keys)
+    positions = np.searchsorted(pre_sorted_keys, post_sorted_keys) + post_ranks
+    in_range = positions < total_pre_rows
+    matched = np.zeros(total_post_rows, dtype=bool)
+    matched[in_range] = pre_sorted_keys[positions[in_range]] == post_sorted_keys[in_range]
+    pre_matched = pre_order[positions[matched]]
+    post_matched = post_order[matched]
+    pre_only_mask = np.ones(total_pre_rows, dtype=bool)
+    pre_only_mask[positions[matched]] = False
+    pre_only = pre_order[pre_only_mask]
+    post_only = post_order[~matched]
+
+    # Only rows whose hashes differ are compared column by column; each column is hashed at the wider of its two widths
+    widths = [max(pre_column.itemsize, post_column.itemsize) for pre_column, post_column in zip(pre_columns, post_columns)]
+    same = (hash_columns(pre_columns, total_pre_rows, widths)[pre_matched] ==
+            hash_columns(post_columns, total_post_rows, widths)[post_matched])
+    if strict:
+        for pre_column, post_column in zip(pre_columns, post_columns):
+            same[same] = pre_column[pre_matched[same]] == post_column[post_matched[same]]
+    changed_pre = pre_matched[~same]
+    changed_post = post_matched[~same]
+    compare_cols = [i for i in range(len(pre_columns)) if i not in primary_key_cols]
+    if compare_cols and len(changed_pre):
+        changed_cells = np.column_stack([np.char.strip(pre_columns[i][changed_pre]) != np.char.strip(post_columns[i][changed_post])
+                                         for i in compare_cols])
+    else:
+        changed_cells = np.zeros((len(changed_pre), 0), dtype=bool)
+
+    log(f"Writing results... {datetime.now()}")
+    sink = SpillSink(keep_matching)
+    # Rows whose values only differ in surrounding whitespace have no differences and count as matching
+    same_after_strip = 0
+    try:
+        for row, (pre_index, post_index) in enumerate(zip(changed_pre, changed_post)):
+            row_diff = []
+            for column in np.flatnonzero(changed_cells[row]):
+                i = compare_cols[column]
+                pre_value = pre_columns[i][pre_index].decode('utf-8')
+                post_value = post_columns[i][post_index].decode('utf-8')
+                # The bytes arrays only strip ASCII whitespace, recheck with str.strip like compare_rows
+                if pre_value.strip() != post_value.strip():
+                    row_diff.append({"column_name": f"Column {i}", "pre_value": pre_value, "post_value": post_value})
+            if row_diff:
+                sink.difference(row_key(pre_columns, primary_key_cols, pre_index), row_diff)
+            else:
+                same_after_strip += 1
+                if keep_matching:
+                    sink.matching(row_key(pre_columns, primary_key_cols, pre_index),
+                                  row_values(pre_columns, pre_index), row_values(post_columns, post_index))
+        for index in pre_only:
+            sink.pre_only(row_key(pre_columns, primary_key_cols, index), row_values(pre_columns, index))
+        for index in post_only:
+            sink.post_only(row_key(post_columns, primary_key_cols, index), row_values(post_columns, index))
+        if keep_matching:
+            for pre_index, post_index in zip(pre_matched[same], post_matched[same]):
+                sink.matching(row_key(pre_columns, primary_key_cols, pre_index),
+                              row_values(pre_columns, pre_index), row_values(post_columns, post_index))
+    except BaseException:
+        sink.discard()
+        raise
+
+    summary = {
+        "total_pre_rows": total_pre_rows,
+        "total_post_rows": total_post_rows,
+        "fully_matching_rows": int(same.sum()) + same_after_strip,
+        "errors": []
+    }
+    summary.update(sink.close())
+    return summary, pre_checksum.hexdigest(), post_checksum.hexdigest()
+
+# Output writing records as JSON Lines, one JSON object per line
+class JsonLinesOutput:
+    def __init__(self, path, fields):
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.file.close()
+
+# Output writing records as a CSV file with a header row; list fields are written as JSON arrays
+class CsvOutput:
+    def __init__(self, path, fields):
+        self.path = path
+        self.list_fields = [name for name, kind in fields if kind == "list"]
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=[name for name, kind in fields])
+        self.writer.writeheader()
+
+    def write(self, record):
+        for name in self.list_fields:
+            if record[name] is not None:
+                record = {**record, name: json.dumps(record[name], ensure_ascii=False)}
+        self.writer.writerow(record)
+
+    def close(self):
+        self.file.close()
+
+# Output writing records to a Parquet file through pyarrow, one row group per batch of records
+class ParquetOutput:
+    def __init__(self, path, fields):
+        if pa_parquet is None:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow)")
+        self.path = path
+        self.schema = pa.schema([(name, pa.list_(pa.string()) if kind == "list" else pa.string()) for name, kind in fields])
+        self.writer = pa_parquet.ParquetWriter(path, self.schema)
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+        if len(self.records) >= OUTPUT_BATCH_ROWS:
+            self.flush()
+
+    def flush(self):
+        if self.records:
+            self.writer.write_table(pa.Table.from_pylist(self.records, schema=self.schema))
+            self.records = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+OUTPUT_WRITERS = {"jsonl": JsonLinesOutput, "csv": CsvOutput, "parquet": ParquetOutput}
+
+# Function to check that the requested output formats exist and can be written
+def check_outputs(output_formats):
+    for output_format in output_formats:
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}, expected one of {', '.join(OUTPUT_FORMATS)}")
+        if output_format == "parquet" and pa_parquet is None:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow)")
+
+# Generator of the output records of a comparison, read back from its spill files in key order:
+# one record per key with differences followed by one per differing column, then the rows only in pre and post
+def iter_output_records(result):
+    empty = dict.fromkeys(name for name, kind in OUTPUT_FIELDS)
+    for key, row_diff in read_spill(result["differences_file"]):
+        key = display_key(key)
+        yield {**empty, "record_type": "key_difference", "key": key}
+        for col_diff in row_diff:
+            yield {**empty, "record_type": "column_difference", "key": key, "column_name": col_diff["column_name"],
+                   "pre_value": col_diff["pre_value"], "post_value": col_diff["post_value"]}
+    for record_type in ("pre_only", "post_only"):
+        for key, row in read_spill(result[f"{record_type}_file"]):
+            yield {**empty, "record_type": record_type, "key": display_key(key), "row": row}
+
+# Function to stream the results of a comparison to one file per output format, named output_base.<format>.
+# Returns the paths written.
+def write_outputs(result, output_formats, output_base):
+    outputs = []
+    try:
+        for output_format in output_formats:
+            outputs.append(OUTPUT_WRITERS[output_format](f"{output_base}.{output_format}", OUTPUT_FIELDS))
+        for record in iter_output_records(result):
+            for output in outputs:
+                output.write(record)
+    finally:
+        for output in outputs:
+            output.close()
+    return [output.path for output in outputs]
+
+# Function to highlight differences. Long values are marked whole, since a character diff grows with the product
+# of their lengths; they are not cached, so the cache never holds long values or their markup.
 def highlight_differences(pre_value, post_value):
+    if len(pre_value) > HIGHLIGHT_MAX_LENGTH or len(post_value) > HIGHLIGHT_MAX_LENGTH:
+        return (f"<span style='background-color: #ff0000'>{pre_value}</span>",
+                f"<span style='background-color: #ff0000'>{post_value}</span>")
+    return highlight_characters(pre_value, post_value)
+
+# Function to highlight the changed characters of two short values. Results are memoized because the same
+# value pairs often repeat down a column.
+@lru_cache(maxsize=HIGHLIGHT_CACHE_SIZE)
+def highlight_characters(pre_value, post_value):
     highlighted_pre = []
     highlighted_post = []
     diff = difflib.ndiff(pre_value, post_value)
@@ -145,65 +1518,150 @@ def highlight_differences(pre_value, post_value):
             highlighted_post.append(char[2])
     return "".join(highlighted_pre), "".join(highlighted_post)
 
+# Script that highlights changed values in the browser, like highlight_differences: values up to the length limit
+# are diffed character by character (by longest common subsequence), longer ones are marked whole.
+HIGHLIGHT_SCRIPT = """
+const highlightCache = new Map();
+
+function escapeHtml(text) {
+  return String(text).replace(/[&<>"']/g, c => "&#" + c.charCodeAt(0) + ";");
+}
+
+function markChange(text) {
+  return "<span style='background-color: #ff0000'>" + escapeHtml(text) + "</span>";
+}
+
+function diffValues(pre, post) {
+  const a = Array.from(pre), b = Array.from(post);
+  let start = 0, endA = a.length, endB = b.length;
+  while (start < endA && start < endB && a[start] === b[start]) start++;
+  while (endA > start && endB > start && a[endA - 1] === b[endB - 1]) { endA--; endB--; }
+  // lcs[i * width + j] is the length of the longest common subsequence of a[i:endA] and b[j:endB]
+  const width = endB - start + 1;
+  const lcs = new Uint16Array((endA - start + 1) * width);
+  for (let i = endA - 1; i >= start; i--) {
+    for (let j = endB - 1; j >= start; j--) {
+      const cell = (i - start) * width + j - start;
+      lcs[cell] = a[i] === b[j] ? lcs[cell + width + 1] + 1 : Math.max(lcs[cell + width], lcs[cell + 1]);
+    }
+  }
+  const common = escapeHtml(a.slice(0, start).join(""));
+  const highlightedPre = [common], highlightedPost = [common];
+  let i = start, j = start;
+  while (i < endA || j < endB) {
+    const cell = (i - start) * width + j - start;
+    if (i < endA && j < endB && a[i] === b[j]) {
+      highlightedPre.push(escapeHtml(a[i++]));
+      highlightedPost.push(escapeHtml(b[j++]));
+    } else if (j >= endB || (i < endA && lcs[cell + width] >= lcs[cell + 1])) {
+      highlightedPre.push(markChange(a[i++]));
+    } else {
+      highlightedPost.push(markChange(b[j++]));
+    }
+  }
+  const tail = escapeHtml(a.slice(endA).join(""));
+  return [highlightedPre.join("") + tail, highlightedPost.join("") + tail];
+}
+
+function highlightPair(pre, post) {
+  const id = pre + "\\u0000" + post;
+  let pair = highlightCache.get(id);
+  if (!pair) {
+    pair = pre.length > HIGHLIGHT_MAX_LENGTH || post.length > HIGHLIGHT_MAX_LENGTH
+      ? [markChange(pre), markChange(post)] : diffValues(pre, post);
+    if (highlightCache.size >= 10000) highlightCache.clear();
+    highlightCache.set(id, pair);
+  }
+  return pair;
+}
+"""
+
+# Function to write the script that highlights changed values in the browser
+def write_highlight_script(output_file):
+    output_file.write(f"const HIGHLIGHT_MAX_LENGTH = {HIGHLIGHT_MAX_LENGTH};\n")
+    output_file.write(HIGHLIGHT_SCRIPT)
+
+# Function to write the start of a report page: its title, the execution details and the summary tables
+def write_report_header(output_file, pre_file, post_file, result, execution_details, styles=()):
+    output_file.write(f"<html><head><title>Comparison Report - {os.path.splitext(os.path.basename(pre_file))[0]}</title>\n")
+    output_file.write(f"<style>\n")
+    output_file.write(f"body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; }}\n")
+    output_file.write(f"table {{ width: 100%; border-collapse: collapse; width: 100%; margin-bottom: 20px; }}\n")
+    output_file.write(f"table, th, td {{ border: 1px solid black; padding: 8px; text-align: left; }}\n")
+    output_file.write(f"th {{ background-color: #f2f2f2; }}\n")
+    output_file.write(f".pre_diff {{ background-color: #e3f2fd; }}\n")
+    output_file.write(f".post_diff {{ background-color: #ffe0b2; }}\n")
+    output_file.write(f".error {{ color: red; font-weight: bold; }}\n")
+    output_file.writelines(f"{style}\n" for style in styles)
+    output_file.write(f"</style></head><body>\n")
+    output_file.write(f"<h1>Comparison Report - {os.path.splitext(os.path.basename(pre_file))[0]}</h1>\n")
+    output_file.write("<h2>Execution Details</h2>")
+    output_file.write("<table>\n")
+    output_file.write("<tr><th>Detail</th><th>Value</th></tr>\n")
+    output_file.write(f"<tr><td>Executor Name</td><td>{execution_details['executor_name']}</td></tr>\n")
+    output_file.write(f"<tr><td>Start Time</td><td>{execution_details['start_time']}</td></tr>\n")
+    output_file.write(f"<tr><td>End Time</td><td>{execution_details['end_time']}</td></tr>\n")
+    output_file.write(f"<tr><td>Time Taken</td><td>{execution_details['time_taken']}</td></tr>\n")
+    output_file.write(f"<tr><td>Pre File Path</td><td>{pre_file}</td></tr>\n")
+    output_file.write(f"<tr><td>Pre File Checksum</td><td>{execution_details['pre_file_checksum']}</td></tr>\n")
+    output_file.write(f"<tr><td>Post File Path</td><td>{post_file}</td></tr>\n")
+    output_file.write(f"<tr><td>Post File Checksum</td><td>{execution_details['post_file_checksum']}</td></tr>\n")
+    output_file.write(f"<tr><td>MAC Address</td><td>{execution_details['mac_address']}</td></tr>\n")
+    output_file.write("</table>\n")
+
+    total_differences = result["total_differences"]
+    total_errors = len(result["errors"])
+    output_file.write("<h2>Summary</h2>\n")
+    output_file.write("<table>\n")
+    output_file.write("<tr><th>Metric</th><th>Count</th></tr>\n")
+    output_file.write(f"<tr><td>Total rows in Pre</td><td>{result['total_pre_rows']}</td></tr>\n")
+    output_file.write(f"<tr><td>Total rows in Post</td><td>{result['total_post_rows']}</td></tr>\n")
+    output_file.write(f"<tr><td>Matching rows</td><td>{result['fully_matching_rows']}</td></tr>\n")
+    output_file.write(f"<tr><td>Rows only in Pre</td><td>{result['pre_only_rows']}</td></tr>\n")
+    output_file.write(f"<tr><td>Rows only in Post</td><td>{result['post_only_rows']}</td></tr>\n")
+    output_file.write(f"<tr><td>Total rows with differences</td><td>{total_differences}</td></tr>\n")
+    output_file.write(f"<tr><td>Total errors</td><td>{total_errors}</td></tr>\n")
+    output_file.write("</table>\n")
+
+# Script of a report page with deferred highlighting: each differences row is highlighted when it nears the view
+DEFERRED_HIGHLIGHT_SCRIPT = """
+const observer = new IntersectionObserver(entries => {
+  for (const entry of entries) {
+    if (entry.isIntersecting) {
+      observer.unobserve(entry.target);
+      const cells = entry.target.cells;
+      [cells[2].innerHTML, cells[3].innerHTML] = highlightPair(cells[2].textContent, cells[3].textContent);
+    }
+  }
+}, {rootMargin: "500px"});
+document.querySelectorAll("tr.deferred").forEach(row => observer.observe(row));
+"""
+
 # Function to generate the HTML report
-def generate_html_report(pre_file, post_file, result, output_file_path, execution_details):
+def generate_html_report(pre_file, post_file, result, output_file_path, execution_details, highlight="python"):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     user_name = getpass.getuser()
-    pre_checksum = compute_checksum(pre_file)
-    post_checksum = compute_checksum(post_file)
     with open(output_file_path, 'w', encoding='utf-8') as output_file:
-        output_file.write(f"<html><head><title>Comparison Report - {os.path.splitext(os.path.basename(pre_file))[0]}</title>\n")
-        output_file.write(f"<style>\n")
-        output_file.write(f"body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; }}\n")
-        output_file.write(f"table {{ width: 100%; border-collapse: collapse; width: 100%; margin-bottom: 20px; }}\n")
-        output_file.write(f"table, th, td {{ border: 1px solid black; padding: 8px; text-align: left; }}\n")
-        output_file.write(f"th {{ background-color: #f2f2f2; }}\n")
-        output_file.write(f".pre_diff {{ background-color: #e3f2fd; }}\n")
-        output_file.write(f".post_diff {{ background-color: #ffe0b2; }}\n")
-        output_file.write(f".error {{ color: red; font-weight: bold; }}\n")
-        output_file.write(f"</style></head><body>\n")
-        output_file.write(f"<h1>Comparison Report - {os.path.splitext(os.path.basename(pre_file))[0]}</h1>\n")
-        output_file.write("<h2>Execution Details</h2>")
-        output_file.write("<table>\n")
-        output_file.write("<tr><th>Detail</th><th>Value</th></tr>\n")
-        output_file.write(f"<tr><td>Executor Name</td><td>{execution_details['executor_name']}</td></tr>\n")
-        output_file.write(f"<tr><td>Start Time</td><td>{execution_details['start_time']}</td></tr>\n")
-        output_file.write(f"<tr><td>End Time</td><td>{execution_details['end_time']}</td></tr>\n")
-        output_file.write(f"<tr><td>Time Taken</td><td>{execution_details['time_taken']}</td></tr>\n")
-        output_file.write(f"<tr><td>Pre File Path</td><td>{pre_file}</td></tr>\n")
-        output_file.write(f"<tr><td>Pre File Checksum</td><td>{execution_details['pre_file_checksum']}</td></tr>\n")
-        output_file.write(f"<tr><td>Post File Path</td><td>{post_file}</td></tr>\n")
-        output_file.write(f"<tr><td>Post File Checksum</td><td>{execution_details['post_file_checksum']}</td></tr>\n")
-        output_file.write(f"<tr><td>MAC Address</td><td>{execution_details['mac_address']}</td></tr>\n")
-        output_file.write("</table>\n")
-
-        total_differences = len(result["differences"])
-        total_row_pre = result["total_pre_rows"]
-        percent_diff = format((total_differences / total_row_pre), ".4%")
-        total_errors = len(result["errors"])
-        output_file.write("<h2>Summary</h2>\n")
-        output_file.write("<table>\n")
-        output_file.write("<tr><th>Metric</th><th>Count</th></tr>\n")
-        output_file.write(f"<tr><td>Total rows in Pre</td><td>{result['total_pre_rows']}</td></tr>\n")
-        output_file.write(f"<tr><td>Total rows in Post</td><td>{result['total_post_rows']}</td></tr>\n")
-        output_file.write(f"<tr><td>Matching rows</td><td>{result['fully_matching_rows']}</td></tr>\n")
-        output_file.write(f"<tr><td>Rows only in Pre</td><td>{result['pre_only_rows']}</td></tr>\n")
-        output_file.write(f"<tr><td>Rows only in Post</td><td>{result['post_only_rows']}</td></tr>\n")
-        output_file.write(f"<tr><td>Total rows with differences</td><td>{total_differences}</td></tr>\n")
-        output_file.write(f"<tr><td>Total errors</td><td>{total_errors}</td></tr>\n")
-        output_file.write("</table>\n")
+        write_report_header(output_file, pre_file, post_file, result, execution_details)
 
+        total_differences = result["total_differences"]
+        percent_diff = format((total_differences / result["total_pre_rows"]), ".4%")
         if total_differences > 0:
             output_file.write("<h2>Result of Comparison</h2>\n")
             output_file.write("<p>There are differences</p>\n")
             output_file.write(f"<h2>Differences Table - {total_differences} - {percent_diff}</h2>\n")
             output_file.write("<table>\n")
             output_file.write("<tr><th>Composite Key</th><th>Field Name</th><th>Pre Value</th><th>Post Value</th></tr>\n")
-            for diff in result["differences"]:
-                composite_key = diff["primary_key"]
-                for col_diff in diff["differences"]:
-                    highlighted_pre, highlighted_post = highlight_differences(col_diff['pre_value'], col_diff['post_value'])
-                    output_file.write("<tr>\n")
+            for key, row_diff in read_spill(result["differences_file"]):
+                composite_key = display_key(key)
+                for col_diff in row_diff:
+                    if highlight == "browser":
+                        # Written as plain text, the page highlights the rows as they are scrolled into view
+                        highlighted_pre, highlighted_post = escape(col_diff['pre_value']), escape(col_diff['post_value'])
+                        output_file.write("<tr class='deferred'>\n")
+                    else:
+                        highlighted_pre, highlighted_post = highlight_differences(col_diff['pre_value'], col_diff['post_value'])
+                        output_file.write("<tr>\n")
                     output_file.write(f"<td>{composite_key}</td>\n")
                     output_file.write(f"<td>{col_diff['column_name']}</td>\n")
                     output_file.write(f"<td class='pre_diff'>{highlighted_pre}</td>\n")
@@ -214,20 +1672,305 @@ def generate_html_report(pre_file, post_file, result, output_file_path, executio
             output_file.write("<h2>Result of Comparison</h2>\n")
             output_file.write("<p>Both the files are complete match !!</p>\n")
 
-        if result["pre_only_data"]:
+        if result["pre_only_rows"]:
             output_file.write("<h2>Rows only in Pre</h2>\n<ul>\n")
-            for key, row in result["pre_only_data"].items():
-                output_file.write(f"<li><b>Primary Key:</b> {key} <b>Row Data:</b> {row}</li>\n")
+            for key, row in read_spill(result["pre_only_file"]):
+                output_file.write(f"<li><b>Primary Key:</b> {display_key(key)} <b>Row Data:</b> {row}</li>\n")
             output_file.write("</ul>\n")
 
-        if result["post_only_data"]:
+        if result["post_only_rows"]:
             output_file.write("<h2>Rows only in Post</h2>\n<ul>\n")
-            for key, row in result["post_only_data"].items():
-                output_file.write(f"<li><b>Primary Key:</b> {key} <b>Row Data:</b> {row}</li>\n")
+            for key, row in read_spill(result["post_only_file"]):
+                output_file.write(f"<li><b>Primary Key:</b> {display_key(key)} <b>Row Data:</b> {row}</li>\n")
             output_file.write("</ul>\n")
 
+        if highlight == "browser" and total_differences > 0:
+            output_file.write("<script>\n")
+            write_highlight_script(output_file)
+            output_file.write(DEFERRED_HIGHLIGHT_SCRIPT)
+            output_file.write("</script>\n")
         output_file.write("</body></html>\n")
 
+# Writer that streams the rows of one report section into gzip-compressed, base64-encoded data shards.
+# Each shard is a small script that hands its rows to the report page; the page only loads the shards it shows.
+# The first and last key of every shard are kept as the section's index, which is sorted whenever the rows
+# arrive in key order, so a key can be found by loading a single shard.
+class ShardWriter:
+    def __init__(self, data_folder, section, shard_rows=REPORT_SHARD_ROWS):
+        self.data_folder = data_folder
+        self.section = section
+        self.shard_rows = shard_rows
+        self.shards = []
+        self.items = []
+        self.rows = 0
+        self.sorted = True
+        self.last_key = None
+
+    def add(self, key, *values):
+        if self.last_key is not None and key < self.last_key:
+            self.sorted = False
+        self.last_key = key
+        self.items.append([key, *values])
+        if len(self.items) >= self.shard_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.items:
+            return
+        index = len(self.shards)
+        file_name = f"{self.section}_{index:05d}.js"
+        data = base64.b64encode(gzip.compress(json.dumps(self.items, ensure_ascii=False).encode('utf-8')))
+        with open(os.path.join(self.data_folder, file_name), 'w', encoding='ascii') as shard_file:
+            shard_file.write(f'loadShard("{self.section}", {index}, "{data.decode("ascii")}");\n')
+        self.shards.append({"file": file_name, "first": self.items[0][0], "last": self.items[-1][0],
+                            "rows": len(self.items)})
+        self.rows += len(self.items)
+        self.items = []
+
+    def close(self):
+        self.flush()
+        return {"rows": self.rows, "sorted": self.sorted, "shards": self.shards}
+
+# Script of the paged report page. Each section is a virtual scrolling table: only the rows in view are
+# rendered, from shards loaded on demand (a few are kept decoded), and its key search uses the shard index.
+PAGED_REPORT_SCRIPT = """
+const ROW_HEIGHT = REPORT.row_height;
+const MAX_HEIGHT = REPORT.max_height;
+const MAX_CACHED_SHARDS = 16;
+const shardCache = new Map();
+const shardWaiters = new Map();
+
+function loadShard(section, index, data) {
+  const id = section + "/" + index;
+  const waiter = shardWaiters.get(id);
+  if (!waiter) return;
+  shardWaiters.delete(id);
+  const bytes = Uint8Array.from(atob(data), c => c.charCodeAt(0));
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"));
+  new Response(stream).json().then(waiter.resolve, waiter.reject);
+}
+
+function getShard(section, index) {
+  const id = section + "/" + index;
+  let promise = shardCache.get(id) || (shardWaiters.get(id) || {}).promise;
+  if (!promise) {
+    const waiter = {};
+    promise = waiter.promise = new Promise((resolve, reject) => Object.assign(waiter, {resolve, reject}));
+    shardWaiters.set(id, waiter);
+    const script = document.createElement("script");
+    script.src = encodeURIComponent(REPORT.folder) + "/" + REPORT.sections[section].shards[index].file;
+    script.onload = () => script.remove();
+    script.onerror = () => {
+      shardWaiters.delete(id);
+      shardCache.delete(id);
+      script.remove();
+      waiter.reject(new Error("Cannot load " + script.src));
+    };
+    document.head.appendChild(script);
+  }
+  // Keep the most recently used shards, dropping the oldest
+  shardCache.delete(id);
+  if (shardCache.size >= MAX_CACHED_SHARDS) {
+    shardCache.delete(shardCache.keys().next().value);
+  }
+  shardCache.set(id, promise);
+  return promise;
+}
+
+function displayKey(key) {
+  return key.split("\\u0000").join("|");
+}
+
+const renderers = {
+  differences: item => {
+    const [pre, post] = REPORT.highlight === "browser" ? highlightPair(item[2], item[3]) : [item[2], item[3]];
+    return "<td>" + escapeHtml(displayKey(item[0])) + "</td><td>" + escapeHtml(item[1]) +
+      "</td><td class='pre_diff'>" + pre + "</td><td class='post_diff'>" + post + "</td>";
+  },
+  pre_only: item => "<td>" + escapeHtml(displayKey(item[0])) + "</td><td>" + escapeHtml(JSON.stringify(item[1])) + "</td>",
+  post_only: item => "<td>" + escapeHtml(displayKey(item[0])) + "</td><td>" + escapeHtml(JSON.stringify(item[1])) + "</td>",
+};
+
+function shardOfRow(spec, row) {
+  let low = 0, high = spec.starts.length - 1;
+  while (low < high) {
+    const middle = (low + high + 1) >> 1;
+    if (spec.starts[middle] <= row) low = middle; else high = middle - 1;
+  }
+  return low;
+}
+
+async function readRows(section, first, last) {
+  const spec = REPORT.sections[section];
+  const rows = [];
+  for (let i = shardOfRow(spec, first); i < spec.shards.length && spec.starts[i] < last; i++) {
+    const items = await getShard(section, i);
+    rows.push(...items.slice(Math.max(first - spec.starts[i], 0), last - spec.starts[i]));
+  }
+  return rows;
+}
+
+async function findKey(section, key) {
+  const spec = REPORT.sections[section];
+  let candidates = spec.shards.map((shard, i) => i);
+  if (spec.sorted) {
+    // First shard whose last key is not below the key
+    let low = 0, high = spec.shards.length;
+    while (low < high) {
+      const middle = (low + high) >> 1;
+      if (spec.shards[middle].last < key) low = middle + 1; else high = middle;
+    }
+    candidates = low < spec.shards.length && spec.shards[low].first <= key ? [low] : [];
+  }
+  for (const i of candidates) {
+    const index = (await getShard(section, i)).findIndex(item => item[0] === key);
+    if (index >= 0) return spec.starts[i] + index;
+  }
+  return -1;
+}
+
+function setupSection(section) {
+  const spec = REPORT.sections[section];
+  const viewport = document.getElementById(section + "_viewport");
+  const header = document.getElementById(section + "_header");
+  const body = viewport.querySelector("tbody");
+  const table = viewport.querySelector("table");
+  const status = document.getElementById(section + "_status");
+  spec.starts = [];
+  let total = 0;
+  for (const shard of spec.shards) {
+    spec.starts.push(total);
+    total += shard.rows;
+  }
+  // A section taller than MAX_HEIGHT gets a spacer of MAX_HEIGHT, and its scroll range maps proportionally to the
+  // first rows from 0 to the last full page; the table is then kept at the top of the view
+  const height = Math.min(spec.rows * ROW_HEIGHT, MAX_HEIGHT);
+  const scaled = spec.rows * ROW_HEIGHT > height;
+  viewport.querySelector(".spacer").style.height = height + "px";
+  const lastFirstRow = () => Math.max(spec.rows - Math.floor(viewport.clientHeight / ROW_HEIGHT), 0);
+  const scrollRange = () => Math.max(height - viewport.clientHeight, 1);
+  const rowOfScroll = scrollTop => scaled ?
+    Math.min(Math.floor(scrollTop / scrollRange() * lastFirstRow()), lastFirstRow()) : Math.floor(scrollTop / ROW_HEIGHT);
+  const scrollOfRow = row => scaled ? Math.min(row, lastFirstRow()) / lastFirstRow() * scrollRange() : row * ROW_HEIGHT;
+  let ticket = 0;
+  let found = -1;
+  // Row shown first after a key search, while the view stays where the search scrolled it: with more rows than
+  // pixels of scroll range, several rows map to the same scroll position
+  let jump = null;
+  const draw = async () => {
+    const current = ++ticket;
+    if (jump && jump.scrollTop !== viewport.scrollTop) jump = null;
+    const first = jump ? jump.row : rowOfScroll(viewport.scrollTop);
+    const last = Math.min(spec.rows, first + Math.ceil(viewport.clientHeight / ROW_HEIGHT) + 1);
+    try {
+      const rows = await readRows(section, first, last);
+      if (current !== ticket) return;
+      header.style.width = viewport.clientWidth + "px";
+      table.style.top = (scaled ? viewport.scrollTop : first * ROW_HEIGHT) + "px";
+      body.innerHTML = rows.map((item, i) =>
+        "<tr" + (first + i === found ? " class='found'" : "") + ">" + renderers[section](item) + "</tr>").join("");
+    } catch (error) {
+      status.textContent = error.message;
+    }
+  };
+  let scheduled = false;
+  viewport.addEventListener("scroll", () => {
+    if (!scheduled) {
+      scheduled = true;
+      requestAnimationFrame(() => { scheduled = false; draw(); });
+    }
+  });
+  document.getElementById(section + "_search").addEventListener("submit", async event => {
+    event.preventDefault();
+    const query = event.target.elements.key.value;
+    // Keys are shown with their columns joined by |, look for the composite key first and then the text as given
+    let row = await findKey(section, query.split("|").join("\\u0000"));
+    if (row < 0 && query.includes("|")) row = await findKey(section, query);
+    status.textContent = row < 0 ? "Key not found" : "Row " + (row + 1) + " of " + spec.rows;
+    found = row;
+    if (row >= 0) {
+      viewport.scrollTop = scrollOfRow(row);
+      if (scaled) jump = {row, scrollTop: viewport.scrollTop};
+    }
+    draw();
+  });
+  draw();
+}
+
+for (const section in REPORT.sections) setupSection(section);
+"""
+
+# Function to write one section of the paged report page: its heading, key search form and virtual scrolling table
+def write_paged_section(output_file, section, title, columns):
+    output_file.write(f"<div class='section'>\n<h2>{title}</h2>\n")
+    output_file.write(f"<form id='{section}_search'>Find key: <input name='key' size='40'> <button>Find</button> "
+                      f"<span id='{section}_status'></span></form>\n")
+    colgroup = "<colgroup>" + "".join(f"<col style='width: {width}'>" for name, width in columns) + "</colgroup>"
+    output_file.write(f"<table class='header' id='{section}_header'>{colgroup}<tr>" + "".join(f"<th>{name}</th>" for name, width in columns)
+                      + "</tr></table>\n")
+    output_file.write(f"<div class='viewport' id='{section}_viewport'><div class='spacer'></div>"
+                      f"<table>{colgroup}<tbody></tbody></table></div>\n</div>\n")
+
+# Function to generate the paged HTML report: a small index page with the execution details and summary,
+# plus a data folder of compressed shards holding the differences and only-rows. The spill files are
+# streamed into the shards one shard at a time, so the report is written in bounded memory.
+def generate_paged_report(pre_file, post_file, result, output_file_path, execution_details, highlight="python"):
+    data_folder = os.path.splitext(output_file_path)[0] + "_data"
+    os.makedirs(data_folder, exist_ok=True)
+    sections = {}
+    if result["total_differences"]:
+        shards = ShardWriter(data_folder, "differences")
+        for key, row_diff in read_spill(result["differences_file"]):
+            for col_diff in row_diff:
+                if highlight == "browser":
+                    # The page highlights the values of the rows it shows
+                    shards.add(key, col_diff['column_name'], col_diff['pre_value'], col_diff['post_value'])
+                else:
+                    highlighted_pre, highlighted_post = highlight_differences(col_diff['pre_value'], col_diff['post_value'])
+                    shards.add(key, col_diff['column_name'], highlighted_pre, highlighted_post)
+        sections["differences"] = shards.close()
+    for section in ("pre_only", "post_only"):
+        if result[f"{section}_rows"]:
+            shards = ShardWriter(data_folder, section)
+            for key, row in read_spill(result[f"{section}_file"]):
+                shards.add(key, row)
+            sections[section] = shards.close()
+
+    report = {"folder": os.path.basename(data_folder), "row_height": PAGED_REPORT_ROW_HEIGHT,
+              "max_height": PAGED_REPORT_MAX_HEIGHT, "highlight": highlight, "sections": sections}
+    styles = [
+        ".section { margin-bottom: 20px; }",
+        ".header { table-layout: fixed; margin: 0; }",
+        ".viewport { position: relative; height: 600px; overflow-y: auto; border: 1px solid black; }",
+        ".viewport table { position: absolute; top: 0; table-layout: fixed; margin: 0; }",
+        f".viewport td {{ height: {PAGED_REPORT_ROW_HEIGHT}px; box-sizing: border-box; padding: 4px 8px; "
+        "white-space: nowrap; overflow: hidden; text-overflow: ellipsis; }",
+        ".viewport tr.found td { outline: 2px solid #ff9800; }",
+    ]
+    with open(output_file_path, 'w', encoding='utf-8') as output_file:
+        write_report_header(output_file, pre_file, post_file, result, execution_details, styles)
+
+        total_differences = result["total_differences"]
+        percent_diff = format((total_differences / result["total_pre_rows"]), ".4%")
+        output_file.write("<h2>Result of Comparison</h2>\n")
+        if total_differences > 0:
+            output_file.write("<p>There are differences</p>\n")
+            write_paged_section(output_file, "differences", f"Differences Table - {total_differences} - {percent_diff}",
+                                [("Composite Key", "20%"), ("Field Name", "14%"), ("Pre Value", "33%"), ("Post Value", "33%")])
+        else:
+            output_file.write("<p>Both the files are complete match !!</p>\n")
+        if "pre_only" in sections:
+            write_paged_section(output_file, "pre_only", "Rows only in Pre", [("Primary Key", "25%"), ("Row Data", "75%")])
+        if "post_only" in sections:
+            write_paged_section(output_file, "post_only", "Rows only in Post", [("Primary Key", "25%"), ("Row Data", "75%")])
+
+        # The shard index is embedded in the page; escape "</" so no key can end the script element early
+        output_file.write("<script>\nconst REPORT = " + json.dumps(report).replace("</", "<\\/") + ";\n")
+        write_highlight_script(output_file)
+        output_file.write(PAGED_REPORT_SCRIPT)
+        output_file.write("</script>\n</body></html>\n")
+    return data_folder
+
 def get_mac_address():
     """
     Get the MAC address of the computer.
@@ -236,27 +1979,411 @@ def get_mac_address():
                      for elements in range(0, 2 * 6, 2) ][ ::- 1])
 
 
+# Function to compare the contents of two files of the same size. A few blocks spread over both files are compared
+# first, so most changed files are told apart after reading a little of each; then the files are compared block by
+# block, stopping at the first difference, and the checksum is computed from the same reads.
+# Returns the checksum of the identical files, or None when they differ.
+def identical_contents(pre_file, post_file):
+    size = os.path.getsize(pre_file)
+    with open(pre_file, 'rb') as pre, open(post_file, 'rb') as post:
+        for sample in range(IDENTICAL_SAMPLE_BLOCKS):
+            offset = size * sample // IDENTICAL_SAMPLE_BLOCKS
+            pre.seek(offset)
+            post.seek(offset)
+            if pre.read(IDENTICAL_SAMPLE_SIZE) != post.read(IDENTICAL_SAMPLE_SIZE):
+                return None
+        pre.seek(0)
+        post.seek(0)
+        checksum = hashlib.sha256()
+        while block := pre.read(CHECKSUM_BLOCK_SIZE):
+            if block != post.read(CHECKSUM_BLOCK_SIZE):
+                return None
+            checksum.update(block)
+    return checksum.hexdigest()
+
+# Function to detect byte-identical inputs, by size first and then by their contents (see identical_contents),
+# so files that differ are usually not read in full before the comparison engine reads them.
+# Identical files get the complete match summary from a single counting pass, with no sort, merge or row hashing.
+# Returns the summary and the shared checksum, or None when the files differ.
+def compare_identical_files(pre_file, post_file, primary_key_cols, log=print):
+    delimiter = determine_delimiter(pre_file)
+    if os.path.getsize(pre_file) != os.path.getsize(post_file) or delimiter != determine_delimiter(post_file):
+        return None
+    log(f"Files have the same size, comparing their contents... {datetime.now()}")
+    checksum = identical_contents(pre_file, post_file)
+    if checksum is None:
+        return None
+    log(f"Files are identical, counting rows... {datetime.now()}")
+    rows = count_rows(pre_file, delimiter, primary_key_cols)
+    result = {
+        "total_pre_rows": rows,
+        "total_post_rows": rows,
+        "fully_matching_rows": rows,
+        "errors": []
+    }
+    result.update(SpillSink().close())
+    return result, checksum
+
+# Function to remove a sorted temp file; runs kept in the index cache stay where they are
+def remove_sorted_file(sorted_file):
+    if not sorted_file.get("cached"):
+        os.unlink(sorted_file["path"])
+
+# Function to return the size, modification time and inode that identify an unchanged file
+def file_identity(file_path):
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "inode": stat.st_ino}
+
+# Folder of sorted runs kept between runs, so an unchanged baseline compared against many post files is only sorted
+# once. Entries are keyed by the input checksum, the key columns and the row fingerprint; each is a .run file (the
+# sorted temp file) and a .json manifest with its metadata and the paths it was used for. A file is matched to its
+# checksum by path, size, modification time and inode when it was seen before, and otherwise only read for its
+# checksum when an entry of the same input size exists. Least recently used entries are removed once the runs take more than max_size bytes.
+class IndexCache:
+    def __init__(self, folder, max_size=DEFAULT_INDEX_CACHE_SIZE, log=print):
+        self.folder = folder
+        self.max_size = parse_size(max_size)
+        self.log = log
+
+    def entry_paths(self, checksum, primary_key_cols, fingerprint):
+        name = hashlib.sha256(json.dumps([checksum, primary_key_cols, fingerprint]).encode('utf-8')).hexdigest()
+        return os.path.join(self.folder, name + ".json"), os.path.join(self.folder, name + ".run")
+
+    # Returns the (manifest path, manifest) pairs of the cache, oldest use first
+    def manifests(self):
+        entries = []
+        if not os.path.isdir(self.folder):
+            return entries
+        for name in os.listdir(self.folder):
+            if name.endswith(".json"):
+                manifest_path = os.path.join(self.folder, name)
+                try:
+                    with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+                        entries.append((manifest_path, json.load(manifest_file)))
+                except (OSError, ValueError):
+                    continue
+        entries.sort(key=lambda entry: entry[1].get("last_used", 0))
+        return entries
+
+    def write_manifest(self, manifest_path, manifest):
+        manifest["last_used"] = datetime.now().timestamp()
+        with open(manifest_path + ".tmp", 'w', encoding='utf-8') as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    # Returns the sorted temp file metadata of a cached run of the file, or None
+    def lookup(self, file_path, primary_key_cols, fingerprint):
+        identity = file_identity(file_path)
+        absolute_path = os.path.abspath(file_path)
+        manifests = self.manifests()
+        checksum = next((manifest["checksum"] for manifest_path, manifest in manifests
+                         if manifest.get("files", {}).get(absolute_path) == identity), None)
+        if checksum is None:
+            if not any(manifest.get("input_size") == identity["size"] for manifest_path, manifest in manifests):
+                return None
+            self.log(f"Computing the checksum of {file_path} for the index cache... {datetime.now()}")
+            checksum = compute_checksum(file_path)
+        manifest_path, run_path = self.entry_paths(checksum, primary_key_cols, fingerprint)
+        manifest = next((manifest for path, manifest in manifests if path == manifest_path), None)
+        if manifest is None or not os.path.exists(run_path) or os.path.getsize(run_path) != manifest["size"]:
+            return None
+        manifest["files"][absolute_path] = identity
+        try:
+            self.write_manifest(manifest_path, manifest)
+        except OSError as error:
+            self.log(f"Could not update the index cache entry of {file_path}: {error}")
+        self.log(f"Using the cached sorted run of {file_path} ({manifest['rows']} rows)")
+        return {"path": run_path, "checksum": checksum, "rows": manifest["rows"], "size": manifest["size"],
+                "input_size": manifest["input_size"], "cached": True}
+
+    # Moves the sorted temp files that are not cached yet into the cache, then evicts old entries beyond the size cap.
+    # Files are given as (input path, sorted temp file metadata) pairs; their entries are never evicted here.
+    def store(self, sorted_files, primary_key_cols, fingerprint):
+        in_use = set()
+        for file_path, sorted_file in sorted_files:
+            manifest_path, run_path = self.entry_paths(sorted_file["checksum"], primary_key_cols, fingerprint)
+            in_use.add(manifest_path)
+            if sorted_file.get("cached") or sorted_file["size"] > self.max_size:
+                continue
+            try:
+                os.makedirs(self.folder, exist_ok=True)
+                shutil.move(sorted_file["path"], run_path + ".tmp")
+                os.replace(run_path + ".tmp", run_path)
+                sorted_file.update(path=run_path, cached=True)
+                self.write_manifest(manifest_path, {
+                    "files": {os.path.abspath(file_path): file_identity(file_path)},
+                    "checksum": sorted_file["checksum"],
+                    "primary_key_cols": primary_key_cols,
+                    "fingerprint": fingerprint,
+                    "rows": sorted_file["rows"],
+                    "size": sorted_file["size"],
+                    "input_size": sorted_file["input_size"]
+                })
+            except OSError as error:
+                self.log(f"Could not add {file_path} to the index cache: {error}")
+        try:
+            self.evict(in_use)
+        except OSError as error:
+            self.log(f"Could not evict old index cache entries: {error}")
+
+    # Removes the least recently used entries, except those in use, until the runs fit in the size cap
+    def evict(self, in_use=()):
+        manifests = self.manifests()
+        total_size = sum(manifest.get("size", 0) for manifest_path, manifest in manifests)
+        for manifest_path, manifest in manifests:
+            if total_size <= self.max_size:
+                break
+            if manifest_path in in_use:
+                continue
+            self.log(f"Evicting the cached sorted run of {', '.join(manifest.get('files', ()))} from the index cache")
+            run_path = manifest_path[:-len(".json")] + ".run"
+            os.unlink(manifest_path)
+            if os.path.exists(run_path):
+                os.unlink(run_path)
+            total_size -= manifest.get("size", 0)
+
+# Function to sort the pre and post files, in worker processes when more than one job is allowed;
+# large unquoted files are also parsed in byte ranges by several workers. With block_tree the Merkle tree of each
+# sorted file is built while the file is written (cached runs are read for theirs) and returned under "tree".
+# With an index cache, files sorted in an earlier run are taken from the cache and newly sorted files are added to it.
+def sort_files_to_temp(pre_file, post_file, primary_key_cols, memory_limit=DEFAULT_MEMORY_LIMIT, jobs=DEFAULT_JOBS, log=print,
+                       fingerprint=DEFAULT_FINGERPRINT, block_tree=False, index_cache=None):
+    file_paths = (pre_file, post_file)
+    file_args = [(file_path, determine_delimiter(file_path), primary_key_cols, memory_limit, fingerprint)
+                 for file_path in file_paths]
+    sorted_files = [index_cache.lookup(file_path, primary_key_cols, fingerprint) if index_cache else None
+                    for file_path in file_paths]
+    if jobs < 2:
+        try:
+            for index, (label, args) in enumerate(zip(("pre", "post"), file_args)):
+                if sorted_files[index] is None:
+                    log(f"Sorting {label} file... {datetime.now()}")
+                    sorted_files[index] = sort_file_to_temp(*args, block_tree)
+            if block_tree:
+                for file_path, sorted_file in zip(file_paths, sorted_files):
+                    if "tree" not in sorted_file:
+                        log(f"Building the Merkle tree of the cached sorted run of {file_path}... {datetime.now()}")
+                        sorted_file["tree"] = build_sorted_tree(sorted_file["path"])
+        except BaseException:
+            for sorted_file in sorted_files:
+                if sorted_file is not None:
+                    remove_sorted_file(sorted_file)
+            raise
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            sorts = {}
+            try:
+                if None in sorted_files:
+                    log(f"Sorting pre and post files in parallel... {datetime.now()}")
+                for index, args in enumerate(file_args):
+                    if sorted_files[index] is None:
+                        sorts[index] = PoolSort(executor, *args[:4], fingerprint, jobs, log, index_cache is not None,
+                                                block_tree)
+                for sort in sorts.values():
+                    sort.merge()
+                for index, sort in sorts.items():
+                    sorted_files[index] = sort.result()
+                if block_tree:
+                    trees = {index: executor.submit(build_sorted_tree, sorted_file["path"])
+                             for index, sorted_file in enumerate(sorted_files) if "tree" not in sorted_file}
+                    if trees:
+                        log(f"Building the Merkle trees of cached sorted runs... {datetime.now()}")
+                    for index, tree in trees.items():
+                        sorted_files[index]["tree"] = tree.result()
+            except BaseException:
+                # Remove the output of whichever sort succeeded before reporting the failure
+                for sort in sorts.values():
+                    sort.discard()
+                raise
+    if index_cache:
+        index_cache.store(zip(file_paths, sorted_files), primary_key_cols, fingerprint)
+    return tuple(sorted_files)
+
+# Function to compare two saved Merkle trees and write the key ranges of the blocks that differ to a JSON Lines
+# file in the output folder. Neither input file is read, so this only locates changes; rows are not compared.
+def compare_saved_trees(pre_tree_path, post_tree_path, primary_key_cols, output_folder, log=print):
+    log(f"Comparing Merkle trees... {datetime.now()}")
+    result = compare_block_tree_files(pre_tree_path, post_tree_path)
+    if result["primary_key_cols"] != primary_key_cols:
+        raise ValueError(f"The Merkle trees were built for key columns {result['primary_key_cols']}, not {primary_key_cols}")
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    name = os.path.splitext(os.path.basename(pre_tree_path)[:-len(MERKLE_TREE_SUFFIX)])[0]
+    ranges_path = os.path.join(output_folder, f"FileCompare_Ranges_{name}_{timestamp}.jsonl")
+    with open(ranges_path, 'w', encoding='utf-8') as ranges_file:
+        for key_range in result["ranges"]:
+            ranges_file.write(json.dumps(key_range, ensure_ascii=False) + "\n")
+    log(f"{result['matched_rows']} rows in matching blocks, {len(result['ranges'])} changed blocks "
+        f"({result['pre_blocks']} pre and {result['post_blocks']} post blocks in all)")
+    log(f"Changed key ranges: {ranges_path}")
+    result["ranges_path"] = ranges_path
+    return result
+
+# Function to sample a file for the estimate mode in one pass: the distinct keys with the smallest 64-bit key hashes
+# are kept (a bottom-k sample) with their row fingerprints, so memory stays fixed whatever the size of the file.
+# Rows are only fingerprinted once their key is sampled. Returns the sample and the number of rows.
+def sketch_file(file_path, delimiter, primary_key_cols, size=ESTIMATE_SAMPLE_SIZE, fingerprint=DEFAULT_FINGERPRINT):
+    heap = []  # Negated key hashes of the sample, so the largest is on top
+    sample = {}
+    rows = 0
+    for key, row, row_hash, header in file_generator(file_path, delimiter, primary_key_cols, fingerprint=None):
+        rows += 1
+        key_hash = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+        if key_hash in sample:
+            continue
+        if len(heap) < size:
+            heapq.heappush(heap, -key_hash)
+        elif key_hash < -heap[0]:
+            del sample[-heapq.heapreplace(heap, -key_hash)]
+        else:
+            continue
+        sample[key_hash] = compute_row_hash(row, fingerprint)
+    return sample, rows
+
+# Function to estimate how the keys of two files compare from their samples. The smallest hashes of the union of
+# both samples are a uniform sample of all distinct keys, and each of them is known to be in a file or not.
+# The share of each category is scaled by the estimated number of distinct keys (k - 1) / h_k, where h_k is the
+# k-th smallest hash as a fraction of the hash range. Returns (estimate, bound) per category, the bound being
+# about two standard deviations (95%); when every key fits in the samples the counts are exact.
+def estimate_from_samples(pre_sample, post_sample, size=ESTIMATE_SAMPLE_SIZE):
+    union = heapq.nsmallest(size, pre_sample.keys() | post_sample.keys())
+    counts = dict.fromkeys(ESTIMATE_CATEGORIES, 0)
+    for key_hash in union:
+        if key_hash not in post_sample:
+            counts["pre_only"] += 1
+        elif key_hash not in pre_sample:
+            counts["post_only"] += 1
+        elif pre_sample[key_hash] == post_sample[key_hash]:
+            counts["matching"] += 1
+        else:
+            counts["changed"] += 1
+    if len(union) < size:
+        return {category: (count, 0) for category, count in counts.items()}
+    distinct_keys = (size - 1) / ((union[-1] + 1) / 2 ** 64)
+    estimates = {}
+    for category, count in counts.items():
+        share = count / size
+        deviation = distinct_keys * math.sqrt(share * (1 - share) / size + share * share / (size - 2))
+        estimates[category] = (round(share * distinct_keys), math.ceil(1.96 * deviation))
+    return estimates
+
+# Function to estimate the result of a comparison in one pass over each file (both at once with 2 or more jobs),
+# in fixed memory. Row totals are exact; the other counts are of distinct keys, with their error bounds.
+def estimate_files(pre_file, post_file, primary_key_cols, jobs=DEFAULT_JOBS, log=print, fingerprint=DEFAULT_FINGERPRINT,
+                   size=ESTIMATE_SAMPLE_SIZE):
+    pre_args = (pre_file, determine_delimiter(pre_file), primary_key_cols, size, fingerprint)
+    post_args = (post_file, determine_delimiter(post_file), primary_key_cols, size, fingerprint)
+    log(f"Sampling {size} keys of the pre and post files... {datetime.now()}")
+    if jobs < 2:
+        (pre_sample, pre_rows), (post_sample, post_rows) = sketch_file(*pre_args), sketch_file(*post_args)
+    else:
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            pre_future = executor.submit(sketch_file, *pre_args)
+            post_future = executor.submit(sketch_file, *post_args)
+            (pre_sample, pre_rows), (post_sample, post_rows) = pre_future.result(), post_future.result()
+    estimates = estimate_from_samples(pre_sample, post_sample, size)
+    estimates["total_pre_rows"] = pre_rows
+    estimates["total_post_rows"] = post_rows
+    return estimates
+
 # Main function to compare files and generate a report
-def compare_files_and_generate_report(pre_file, post_file, primary_key_cols, output_folder):
+def compare_files_and_generate_report(pre_file, post_file, primary_key_cols, output_folder, memory_limit=DEFAULT_MEMORY_LIMIT,
+                                      jobs=DEFAULT_JOBS, log=print, engine="sort", partitions=None, keep_matching=False,
+                                      fingerprint=DEFAULT_FINGERPRINT, strict=False, presorted=False, presorted_fallback="sort",
+                                      key_order="text",
+                                      report="html", outputs=(), html=True, highlight="python", estimate=False,
+                                      merkle_tree=False, index_cache=None, index_cache_size=DEFAULT_INDEX_CACHE_SIZE):
     primary_key_cols = list(map(int, primary_key_cols.split(",")))
+    if report not in REPORT_MODES:
+        raise ValueError(f"Unknown report mode: {report}, expected one of {', '.join(REPORT_MODES)}")
+    check_outputs(outputs)
+    if highlight not in HIGHLIGHT_MODES:
+        raise ValueError(f"Unknown highlight mode: {highlight}, expected one of {', '.join(HIGHLIGHT_MODES)}")
+    if presorted and engine != "sort":
+        raise ValueError("Presorted inputs can only be compared with the sort engine")
+    parse_key_order(key_order, primary_key_cols)
+    if merkle_tree and engine != "sort":
+        raise ValueError("Merkle trees can only be built with the sort engine")
+    if strict:
+        # Strict mode uses SHA-256 and rechecks the full row whenever the digests match
+        fingerprint = "sha256"
+    check_fingerprint(fingerprint)
+    if estimate:
+        # Quick sizing only: sample both files and log the approximate counts, no report is written
+        estimates = estimate_files(pre_file, post_file, primary_key_cols, jobs, log, fingerprint)
+        log(f"Estimated comparison: {estimates['total_pre_rows']} pre rows, {estimates['total_post_rows']} post rows")
+        for category, label in zip(ESTIMATE_CATEGORIES, ("Matching keys", "Changed keys", "Keys only in Pre",
+                                                         "Keys only in Post")):
+            count, bound = estimates[category]
+            log(f"  {label}: ~{count} (+/- {bound})")
+        return estimates
+    if pre_file.endswith(MERKLE_TREE_SUFFIX) and post_file.endswith(MERKLE_TREE_SUFFIX):
+        return compare_saved_trees(pre_file, post_file, primary_key_cols, output_folder, log)
     start_time = datetime.now()
     execution_details = {
         "executor_name": os.getlogin(),
         "start_time": start_time.strftime('%Y-%m-%d %H:%M:%S'),
-        "pre_file_checksum": compute_checksum(pre_file),
-        "post_file_checksum": compute_checksum(post_file),
         "mac_address": get_mac_address(),
     }
 
-    # Sort files and write to temporary files
-    print(f"Sorting pre file... {datetime.now()}")
-    pre_temp_file = sort_file_to_temp(pre_file, determine_delimiter(pre_file), primary_key_cols)
-    print(f"Sorting post file... {datetime.now()}")
-    post_temp_file = sort_file_to_temp(post_file, determine_delimiter(post_file), primary_key_cols)
+    # Byte-identical files are a complete match; matching rows still go through an engine when they are kept
+    identical = None if keep_matching else compare_identical_files(pre_file, post_file, primary_key_cols, log)
+    # Presorted inputs are streamed straight into the merge; the sort stage only runs if an input turns out to be unsorted
+    streamed = None
+    if presorted and not identical:
+        try:
+            streamed = compare_presorted_files(pre_file, post_file, primary_key_cols, log, keep_matching, strict, fingerprint,
+                                               key_order)
+        except UnsortedInputError as error:
+            if presorted_fallback != "sort":
+                raise
+            log(f"WARNING: the presorted comparison stopped: {error}")
+            log(f"Falling back to sorting both files; the rows read so far are read again. If the files are sorted "
+                f"by numeric keys, use --key-order numeric. {datetime.now()}")
+    # The file checksums are computed while the files are parsed, so each input is read once
+    if identical:
+        result, pre_checksum = identical
+        post_checksum = pre_checksum
+    elif streamed:
+        result, pre_checksum, post_checksum = streamed
+    elif engine == "hash":
+        # Partition both files by key and join the bucket pairs in parallel
+        result, pre_checksum, post_checksum = compare_files_partitioned(pre_file, post_file, primary_key_cols, partitions,
+                                                                       memory_limit, jobs, log, keep_matching, fingerprint,
+                                                                       strict)
+    elif engine == "columnar":
+        # Load both files into NumPy arrays and compare them with vectorized operations
+        result, pre_checksum, post_checksum = compare_files_columnar(pre_file, post_file, primary_key_cols, log, keep_matching,
+                                                                    strict)
+    else:
+        # Sort files and write to temporary files
+        cache = IndexCache(index_cache, index_cache_size, log) if index_cache else None
+        pre_sorted, post_sorted = sort_files_to_temp(pre_file, post_file, primary_key_cols, memory_limit, jobs, log, fingerprint,
+                                                     merkle_tree, cache)
+        pre_checksum = pre_sorted["checksum"]
+        post_checksum = post_sorted["checksum"]
+        if merkle_tree:
+            # Keep the trees next to the inputs so later copies can be compared from the trees alone
+            for file_path, sorted_file in ((pre_file, pre_sorted), (post_file, post_sorted)):
+                try:
+                    save_block_tree(sorted_file["tree"], file_path + MERKLE_TREE_SUFFIX, primary_key_cols, fingerprint,
+                                    sorted_file["checksum"])
+                except OSError as error:
+                    log(f"Could not save the Merkle tree of {file_path}: {error}")
 
-    # Compare sorted files
-    print(f"Comparing files... {datetime.now()}")
-    result = compare_sorted_files(pre_temp_file, post_temp_file, primary_key_cols)
+        # Compare sorted files
+        log(f"Comparing files... {pre_sorted['rows']} pre rows ({pre_sorted['size']} bytes sorted), "
+            f"{post_sorted['rows']} post rows ({post_sorted['size']} bytes sorted) {datetime.now()}")
+        try:
+            result = compare_sorted_files(pre_sorted, post_sorted, primary_key_cols, log, keep_matching, strict)
+        finally:
+            # Clean up temporary files
+            remove_sorted_file(pre_sorted)
+            remove_sorted_file(post_sorted)
+    # Files parsed in byte ranges have no checksum
+    execution_details["pre_file_checksum"] = pre_checksum or "N/A"
+    execution_details["post_file_checksum"] = post_checksum or "N/A"
 
     end_time = datetime.now()
     execution_details["end_time"] = end_time.strftime('%Y-%m-%d %H:%M:%S')
@@ -268,13 +2395,36 @@ def compare_files_and_generate_report(pre_file, post_file, primary_key_cols, out
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     summary_file_name = f"FileCompare_Report_{os.path.splitext(os.path.basename(pre_file))[0]}_{timestamp}.html"
     summary_file_path = os.path.join(output_folder, summary_file_name)
-    print(f"Generate Report HTML.. {datetime.now()}")
-    generate_html_report(pre_file, post_file, result, summary_file_path, execution_details)
-    print(f"Summary and differences report generated: {summary_file_path}")
-
-    # Clean up temporary files
-    os.unlink(pre_temp_file)
-    os.unlink(post_temp_file)
+    if result["matching_file"]:
+        # Matching rows were explicitly requested, keep them next to the report
+        matching_file_path = os.path.join(output_folder, f"FileCompare_Matching_{os.path.splitext(os.path.basename(pre_file))[0]}_{timestamp}.jsonl")
+        with open(matching_file_path, 'w', encoding='utf-8') as matching_file:
+            for key, pre_row, post_row in read_spill(result["matching_file"]):
+                matching_file.write(json.dumps({"primary_key": display_key(key), "pre_row": pre_row, "post_row": post_row},
+                                               ensure_ascii=False) + '\n')
+        log(f"Matching rows written to: {matching_file_path}")
+    try:
+        if outputs:
+            log(f"Writing {', '.join(outputs)} output.. {datetime.now()}")
+            output_base = os.path.join(output_folder, f"FileCompare_Results_{os.path.splitext(os.path.basename(pre_file))[0]}_{timestamp}")
+            for output_path in write_outputs(result, outputs, output_base):
+                log(f"Results written to: {output_path}")
+        if html:
+            log(f"Generate Report HTML.. {datetime.now()}")
+            if report == "paged":
+                data_folder = generate_paged_report(pre_file, post_file, result, summary_file_path, execution_details,
+                                                    highlight)
+                log(f"Report data shards written to: {data_folder}")
+            else:
+                generate_html_report(pre_file, post_file, result, summary_file_path, execution_details, highlight)
+            log(f"Summary and differences report generated: {summary_file_path}")
+        else:
+            log(f"Compared {result['total_pre_rows']} pre rows and {result['total_post_rows']} post rows: "
+                f"{result['fully_matching_rows']} matching, {result['total_differences']} with differences, "
+                f"{result['pre_only_rows']} only in pre, {result['post_only_rows']} only in post")
+    finally:
+        # Clean up spill files
+        remove_spill_files(result)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Compare two files and generate an HTML report.")
@@ -282,6 +2432,65 @@ if __name__ == "__main__":
     parser.add_argument("post_file", type=str, help="The post file to compare")
     parser.add_argument("primary_key_cols", type=str, help="Comma-separated indices of the composite key columns (e.g., 0,1)")
     parser.add_argument("output_folder", type=str, help="The folder to save the report")
+    parser.add_argument("--memory-limit", type=parse_size, default=DEFAULT_MEMORY_LIMIT,
+                        help=f"Memory used to sort each file before spilling sorted runs to disk, e.g. 512M or 2G (default: {DEFAULT_MEMORY_LIMIT})")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"Number of worker processes; with 2 or more the pre and post files are sorted concurrently (default: {DEFAULT_JOBS})")
+    parser.add_argument("--engine", choices=ENGINES, default="sort",
+                        help="sort: sort both files by key and merge them; hash: split both files into buckets by key hash "
+                             "and compare the buckets in parallel; columnar: compare in memory with NumPy (and pyarrow if "
+                             "installed), fastest for wide numeric extracts (default: sort)")
+    parser.add_argument("--partitions", type=int, default=None,
+                        help="Number of buckets for the hash engine (default: based on file size, memory limit and jobs)")
+    parser.add_argument("--keep-matching", action="store_true",
+                        help="Also write the fully matching rows to a JSON Lines file in the output folder")
+    parser.add_argument("--fingerprint", choices=FINGERPRINTS, default=DEFAULT_FINGERPRINT,
+                        help="Row fingerprint used to detect changed rows: 8-byte blake2b, xxh64 (needs the xxhash package) "
+                             f"or sha256 (default: {DEFAULT_FINGERPRINT})")
+    parser.add_argument("--strict", action="store_true",
+                        help="Use SHA-256 row digests and recheck the full row whenever two digests match")
+    parser.add_argument("--presorted", action="store_true",
+                        help="Both files are already sorted by the key columns (in the --key-order order): compare them "
+                             "in one streaming pass without sorting")
+    parser.add_argument("--presorted-fallback", choices=("sort", "fail"), default="sort",
+                        help="What to do when a presorted file has a key out of order: sort the files and compare "
+                             "them as usual, or stop with an error (default: sort)")
+    parser.add_argument("--key-order", default="text",
+                        help="Order of the keys in presorted files: text (UTF-8 text order) or numeric (e.g. exported "
+                             "with ORDER BY an integer key), or one of them per key column separated by commas, "
+                             "e.g. numeric,text (default: text)")
+    parser.add_argument("--report", choices=REPORT_MODES, default="html",
+                        help="html: one page holding every difference; paged: a small index page plus compressed data "
+                             "shards that the browser loads while scrolling, with key search, for millions of "
+                             "differences (default: html)")
+    parser.add_argument("--output", action="append", choices=OUTPUT_FORMATS, default=[],
+                        help="Also stream the differences and only-rows to a machine-readable file in the output folder: "
+                             "jsonl, csv or parquet (needs pyarrow); can be repeated")
+    parser.add_argument("--no-html", action="store_true",
+                        help="Do not write the HTML report, e.g. for batch runs that only need --output files")
+    parser.add_argument("--highlight", choices=HIGHLIGHT_MODES, default="python",
+                        help="python: highlight the changed characters while writing the report; browser: let the report "
+                             "page highlight only the rows that are shown (default: python). Values longer than "
+                             f"{HIGHLIGHT_MAX_LENGTH} characters are highlighted whole")
+    parser.add_argument("--estimate", action="store_true",
+                        help="Only estimate the numbers of matching, changed, pre-only and post-only keys from a fixed-size "
+                             "sample of each file, with 95%% error bounds, in one quick pass and without writing a report")
+    parser.add_argument("--merkle-tree", action="store_true",
+                        help="Build a Merkle tree of block digests over each sorted file, skip the blocks both files share "
+                             "and save the trees next to the inputs as <file>.merkle.json. Passing two saved trees as the "
+                             "pre and post files lists the changed key ranges without reading the data")
+    parser.add_argument("--index-cache",
+                        help="Folder keeping the sorted runs of the inputs between runs, keyed by file checksum and key "
+                             "columns, so an unchanged baseline is only sorted once")
+    parser.add_argument("--index-cache-size", type=parse_size, default=DEFAULT_INDEX_CACHE_SIZE,
+                        help="Total size of the sorted runs kept in the index cache before the least recently used are "
+                             f"removed, e.g. 500M or 10G (default: {DEFAULT_INDEX_CACHE_SIZE})")
     args = parser.parse_args()
     print(f"The Script is starting.. {datetime.now()}")
-    compare_files_and_generate_report(args.pre_file, args.post_file, args.primary_key_cols, args.output_folder)
+    compare_files_and_generate_report(args.pre_file, args.post_file, args.primary_key_cols, args.output_folder, args.memory_limit,
+                                      args.jobs, engine=args.engine, partitions=args.partitions, keep_matching=args.keep_matching,
+                                      fingerprint=args.fingerprint, strict=args.strict, presorted=args.presorted,
+                                      presorted_fallback=args.presorted_fallback, key_order=args.key_order, report=args.report,
+                                      outputs=args.output, html=not args.no_html, highlight=args.highlight,
+                                      estimate=args.estimate, merkle_tree=args.merkle_tree,
+                                      index_cache=args.index_cache, index_cache_size=args.index_cache_size)
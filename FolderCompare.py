@@ -1,11 +1,142 @@
 import os
 import csv
-import sys
+import io
+import argparse
 import hashlib
+import heapq
+import math
+import fnmatch
+import json
+import mmap
+import shutil
+import struct
 # import pyautogui
 import uuid
+from bisect import bisect_right
+from contextlib import ExitStack
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 import tempfile
+from array import array
+from collections import deque
+from functools import partial
+from itertools import chain, islice
+
+# NumPy keeps the row fingerprints in compact sorted arrays
+try:
+    import numpy as np
+except ImportError:
+    np = None
+# xxhash provides the optional xxh64 row fingerprint
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+# pyarrow writes the optional Parquet output
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pa_parquet
+except ImportError:
+    pa = pa_parquet = None
+# resource reads the open-file limit, which bounds the bucket files open at once (not available on Windows)
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Block size used when reading input files
+READ_BLOCK_SIZE = 1024 * 1024
+# Size of the sample checked for quoting before a file is split as bytes
+TOKENIZER_SAMPLE_SIZE = 1024 * 1024
+QUOTE = b'"'
+# Bytes stripped from ASCII cells, the same characters str.strip() removes
+ASCII_WHITESPACE = b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f'
+# Row fingerprints: 8-byte blake2b or xxh64 for change detection, or SHA-256 for strict mode
+FINGERPRINTS = ("blake2b", "xxh64", "sha256")
+DEFAULT_FINGERPRINT = "blake2b"
+# Number of files compared at the same time
+DEFAULT_WORKERS = os.cpu_count() or 1
+# Memory each file comparison may use for its row index before it is partitioned on disk
+DEFAULT_MEMORY_LIMIT = "512M"
+# Approximate memory per row of the array index (including sort temporaries) and of the dict index
+ARRAY_INDEX_ROW_SIZE = 64
+DICT_INDEX_ROW_SIZE = 200
+# On-disk bucket records: row fingerprint, line offset and line length
+ROW_RECORD = struct.Struct('<QQI')
+STRICT_ROW_RECORD = struct.Struct('<32sQI')
+# On-disk only-row position records: line offset and line length
+POSITION_RECORD = struct.Struct('<QI')
+# Number of bucket files kept open at once when the open-file limit is unknown (on Windows, or when unlimited)
+DEFAULT_OPEN_BUCKETS = 256
+# Number and size of the blocks, spread over two files of the same size, compared before their full contents
+IDENTICAL_SAMPLE_BLOCKS = 16
+IDENTICAL_SAMPLE_SIZE = 64 * 1024
+# Number of row records read at a time from bucket and cache files
+RECORD_BATCH = 65536
+# Unquoted files at least this large are hashed in byte ranges by several worker processes
+PARALLEL_PARSE_MIN_SIZE = 64 * 1024 * 1024
+# Size of the byte ranges handed to the workers, which bounds the row records held per range
+PARSE_RANGE_SIZE = 16 * 1024 * 1024
+# Machine-readable output formats the only-rows can be written to, next to or instead of the HTML reports
+OUTPUT_FORMATS = ("jsonl", "csv", "parquet")
+# Fields of an output record: whether the row is only in pre or only in post, and the row's line
+OUTPUT_FIELDS = ("record_type", "row")
+# Number of records buffered per Parquet row group
+OUTPUT_BATCH_ROWS = 65536
+# Number of distinct rows sampled from each file by the estimate mode, which fixes its memory use
+ESTIMATE_SAMPLE_SIZE = 65536
+# Categories of sampled rows reported by the estimate mode
+ESTIMATE_CATEGORIES = ("matching", "pre_only", "post_only")
+
+
+class ChecksumReader(io.RawIOBase):
+    """
+    Raw reader that feeds every byte it reads to a checksum, so a file is hashed while it is parsed.
+    """
+    def __init__(self, file, checksum):
+        self.file = file
+        self.checksum = checksum
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.file.readinto(buffer)
+        if count:
+            self.checksum.update(memoryview(buffer)[:count])
+        return count
+
+    def drain(self):
+        """
+        Hash anything the parser did not read, so the checksum always covers the whole file.
+        """
+        while chunk := self.file.read(READ_BLOCK_SIZE):
+            self.checksum.update(chunk)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+class LineReader:
+    """
+    Iterate over the decoded lines of a binary file, keeping the byte offset where the next line starts.
+    The csv reader pulls one line at a time, so after each row the offset marks the end of that row.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.position = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.file.readline()
+        if not line:
+            raise StopIteration
+        self.position += len(line)
+        return line.decode('utf-8')
 
 
 def compute_checksum(file_path):
@@ -36,6 +167,31 @@ def get_mac_address():
     mac = ':'.join(['{:02x}'.format((uuid.getnode() >> elements) & 0xff) for elements in range(0, 2 * 6, 2)][::-1])
     return mac
 
+def parse_size(size):
+    """
+    Parse a size such as 512M or 2G into a number of bytes.
+    """
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    text = str(size).strip().upper().rstrip("B")
+    try:
+        if text and text[-1] in units:
+            return int(float(text[:-1]) * units[text[-1]])
+        return int(text)
+    except ValueError:
+        raise ValueError(f"Invalid size: {size}") from None
+
+def estimate_rows(file_path):
+    """
+    Estimate the number of rows in a file from the line count of its first block.
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as file:
+        sample = file.read(READ_BLOCK_SIZE)
+    lines = sample.count(b'\n')
+    if len(sample) == size or not lines:
+        return lines + 1
+    return size * lines // len(sample)
+
 def get_file_delimiter(file_path):
     """
     Determine the file delimiter based on the file extension.
@@ -48,24 +204,117 @@ def get_file_delimiter(file_path):
         raise ValueError(f"Unsupported file format: {file_path}. Only .txt and .csv are supported.")
 
 
-def generate_row_hash(row):
+def generate_row_hash(row, fingerprint=DEFAULT_FINGERPRINT):
     """
     Generate a hash for a row after normalizing (trimming whitespace).
+    The 64-bit fingerprints are returned as integers, SHA-256 as raw digest bytes.
     """
     normalized_row = [cell.strip() for cell in row]  # Remove leading/trailing spaces
-    return hashlib.md5("|".join(normalized_row).encode('utf-8')).hexdigest()
+    return hash_row_bytes("|".join(normalized_row).encode('utf-8'), fingerprint)
+
+
+def generate_line_hash(line, delimiter, fingerprint=DEFAULT_FINGERPRINT):
+    """
+    Generate the same hash as generate_row_hash for an unquoted line given as bytes, without its line break.
+    ASCII lines are trimmed as bytes, and lines without any whitespace are hashed without being split;
+    only lines with other characters are decoded.
+    """
+    separator = delimiter.encode('utf-8')
+    if not line.isascii():
+        return generate_row_hash(line.decode('utf-8').split(delimiter), fingerprint)
+    if len(line.translate(None, ASCII_WHITESPACE)) == len(line):
+        # Nothing to trim: the cells joined by | are the line with its delimiters replaced
+        return hash_row_bytes(line.replace(separator, b"|"), fingerprint)
+    return hash_row_bytes(b"|".join([cell.strip(ASCII_WHITESPACE) for cell in line.split(separator)]), fingerprint)
+
+
+def hash_row_bytes(row_bytes, fingerprint=DEFAULT_FINGERPRINT):
+    """
+    Hash a normalized row with the chosen fingerprint.
+    """
+    if fingerprint == "blake2b":
+        return int.from_bytes(hashlib.blake2b(row_bytes, digest_size=8).digest(), 'little')
+    if fingerprint == "xxh64":
+        return xxhash.xxh64_intdigest(row_bytes)
+    return hashlib.sha256(row_bytes).digest()
 
-def generate_overall_summary(pre_folder, post_folder, output_folder, comparison_results):
+
+def check_fingerprint(fingerprint):
+    """
+    Check that a row fingerprint is known and its library is installed.
+    """
+    if fingerprint not in FINGERPRINTS:
+        raise ValueError(f"Unsupported fingerprint: {fingerprint}. Use one of {', '.join(FINGERPRINTS)}.")
+    if fingerprint == "xxh64" and xxhash is None:
+        raise ImportError("The xxh64 fingerprint needs the xxhash package (pip install xxhash)")
+
+def scan_folder(folder, relative_folder):
+    """
+    List one directory with os.scandir.
+    Returns the size of each file, keyed by its path relative to the top folder, and the subdirectories to walk next.
+    """
+    files = {}
+    subfolders = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            relative_path = os.path.join(relative_folder, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                subfolders.append((entry.path, relative_path))
+            elif entry.is_file():
+                files[relative_path] = entry.stat().st_size
+    return files, subfolders
+
+
+def matches_filters(relative_path, include=None, exclude=None):
+    """
+    Check a relative file path against include and exclude glob patterns.
+    A pattern matches either the whole relative path (with / separators) or the file name.
+    """
+    path = relative_path.replace(os.sep, '/')
+    name = os.path.basename(relative_path)
+
+    def matches(patterns):
+        return any(fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+    if include and not matches(include):
+        return False
+    return not (exclude and matches(exclude))
+
+
+def list_files(folder, include=None, exclude=None, workers=DEFAULT_WORKERS):
+    """
+    Recursively list the files of a folder, walking its subdirectories in parallel threads.
+    Returns the size of each file that passes the include and exclude globs, keyed by its path relative to the folder.
+    """
+    files = {}
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        pending = {executor.submit(scan_folder, folder, "")}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                folder_files, subfolders = future.result()
+                files.update((path, size) for path, size in folder_files.items()
+                             if matches_filters(path, include, exclude))
+                pending.update(executor.submit(scan_folder, *subfolder) for subfolder in subfolders)
+    return files
+
+
+def generate_overall_summary(pre_folder, post_folder, output_folder, comparison_results, pre_files=None, post_files=None):
     """
     Generate an overall summary report of the comparison process.
     Tracks:
       - Total files in pre and post folders.
       - Number of matching files.
       - Files missing in either pre or post folders.
+    The file listings made for the comparison can be passed in, otherwise both folders are listed again.
     """
     # Get the list of files
-    pre_files = {f for f in os.listdir(pre_folder) if os.path.isfile(os.path.join(pre_folder, f))}
-    post_files = {f for f in os.listdir(post_folder) if os.path.isfile(os.path.join(post_folder, f))}
+    if pre_files is None:
+        pre_files = list_files(pre_folder)
+    if post_files is None:
+        post_files = list_files(post_folder)
+    pre_files = set(pre_files)
+    post_files = set(post_files)
 
     # Determine matches and mismatches
     matching_files = pre_files & post_files
@@ -256,146 +505,972 @@ def write_html_report(file_name, pre_file, post_file, result, execution_details,
         # HTML Footer
         output_file.write("</body></html>")
 
-def compare_large_files(pre_file, post_file):
+class JsonLinesOutput:
+    """
+    Output writing records as JSON Lines, one JSON object per line.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class CsvOutput:
+    """
+    Output writing records as a CSV file with a header row.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=OUTPUT_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, record):
+        self.writer.writerow(record)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetOutput:
+    """
+    Output writing records to a Parquet file through pyarrow, one row group per batch of records.
+    """
+    def __init__(self, path):
+        if pa_parquet is None:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow)")
+        self.path = path
+        self.schema = pa.schema([(name, pa.string()) for name in OUTPUT_FIELDS])
+        self.writer = pa_parquet.ParquetWriter(path, self.schema)
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+        if len(self.records) >= OUTPUT_BATCH_ROWS:
+            self.flush()
+
+    def flush(self):
+        if self.records:
+            self.writer.write_table(pa.Table.from_pylist(self.records, schema=self.schema))
+            self.records = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+OUTPUT_WRITERS = {"jsonl": JsonLinesOutput, "csv": CsvOutput, "parquet": ParquetOutput}
+
+
+def check_outputs(output_formats):
+    """
+    Check that the requested output formats exist and can be written.
+    """
+    for output_format in output_formats:
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}, expected one of {', '.join(OUTPUT_FORMATS)}")
+        if output_format == "parquet" and pa_parquet is None:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow)")
+
+
+def write_outputs(result, output_formats, output_base):
+    """
+    Stream the only-rows of a comparison to one file per output format, named output_base.<format>,
+    with one record per row only in pre or only in post. Returns the paths written.
+    """
+    outputs = []
+    try:
+        for output_format in output_formats:
+            outputs.append(OUTPUT_WRITERS[output_format](f"{output_base}.{output_format}"))
+        for record_type in ("pre_only", "post_only"):
+            with open(result[f"{record_type}_file"], 'r', encoding='utf-8') as only_file:
+                for line in only_file:
+                    record = {"record_type": record_type, "row": line.rstrip('\n')}
+                    for output in outputs:
+                        output.write(record)
+    finally:
+        for output in outputs:
+            output.close()
+    return [output.path for output in outputs]
+
+
+def use_byte_tokenizer(file_path):
+    """
+    Check whether a file can be split as bytes: it is not empty and a sample from its start has no quotes.
+    """
+    with open(file_path, 'rb') as file:
+        sample = file.read(TOKENIZER_SAMPLE_SIZE)
+    return bool(sample) and QUOTE not in sample
+
+
+def can_split_ranges(file_path):
+    """
+    Check whether a file can be hashed in byte ranges: it is large enough to be worth it and a sample from its start
+    has no quotes. The ranges are checked for quotes as they are hashed, since a quoted row could run across a boundary.
+    """
+    return os.path.getsize(file_path) >= PARALLEL_PARSE_MIN_SIZE and use_byte_tokenizer(file_path)
+
+
+def split_ranges(file_path, parts):
+    """
+    Split the part of a file after its header into about the given number of byte ranges, each ending on a line break.
+    """
+    size = os.path.getsize(file_path)
+    ranges = []
+    with open(file_path, 'rb') as file:
+        file.readline()  # Skip the header
+        start = file.tell()
+        step = max((size - start) // parts, 1)
+        while start < size:
+            file.seek(min(start + step, size) - 1)
+            file.readline()
+            ranges.append((start, file.tell()))
+            start = file.tell()
+    return ranges
+
+
+def scan_range(file_path, delimiter, fingerprint, start, end):
+    """
+    Hash the lines in one byte range of a file, up to the first line holding a quote.
+    Returns their hash, byte offset and line length packed as row records,
+    and the offset of the line holding a quote, or None when the range has none.
+    """
+    record = row_record(fingerprint)
+    packed = bytearray()
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as records:
+        records.seek(start)
+        while start < end:
+            line = records.readline()
+            if QUOTE in line:
+                return bytes(packed), start
+            packed += record.pack(generate_line_hash(line.rstrip(b'\r\n'), delimiter, fingerprint), start, len(line))
+            start += len(line)
+    return bytes(packed), None
+
+
+def scan_row_ranges(file_path, delimiter, fingerprint, parse_workers):
+    """
+    Read a file the way scan_rows does, with the rows hashed in byte ranges by a pool of worker processes.
+    The ranges are collected in file order, with only a few more submitted than there are workers.
+    From the first line holding a quote the rest of the file is read here, as csv reads on through line breaks
+    inside quoted cells. No checksum is computed, so each range is only read by its worker.
+    """
+    parts = max(parse_workers, os.path.getsize(file_path) // PARSE_RANGE_SIZE)
+    ranges = iter(split_ranges(file_path, parts))
+    record = row_record(fingerprint)
+    with open(file_path, 'rb') as file:
+        yield next(csv.reader([file.readline().decode('utf-8')], delimiter=delimiter), None)  # Extract header
+    quote_start = None
+    with ProcessPoolExecutor(max_workers=parse_workers) as executor:
+        pending = deque(executor.submit(scan_range, file_path, delimiter, fingerprint, start, end)
+                        for start, end in islice(ranges, 2 * parse_workers))
+        while pending:
+            packed, quote_start = pending.popleft().result()
+            if quote_start is None:
+                for start, end in islice(ranges, 1):
+                    pending.append(executor.submit(scan_range, file_path, delimiter, fingerprint, start, end))
+            yield from record.iter_unpack(packed)
+            if quote_start is not None:
+                for future in pending:
+                    future.cancel()
+                break
+    if quote_start is not None:
+        with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as records:
+            yield from scan_lines(records, quote_start, delimiter, fingerprint)
+
+
+def scan_lines(records, start, delimiter, fingerprint, checksum=None):
+    """
+    Hash the lines of a mapped file from a byte offset on; lines are only split and decoded when they need it.
+    Yields the hash, byte offset and line length of each row. A checksum, when given, is fed every byte
+    from the start of the file, a block of lines at a time, so the mapping is walked once.
+    """
+    records.seek(start)
+    lines = iter(records.readline, b'')
+    hashed = 0
+    for line in lines:
+        if QUOTE in line:
+            # csv reads on through line breaks inside quoted cells
+            texts = (text.decode('utf-8') for text in chain([line], lines))
+            row_hash = generate_row_hash(next(csv.reader(texts, delimiter=delimiter)), fingerprint)
+        else:
+            row_hash = generate_line_hash(line.rstrip(b'\r\n'), delimiter, fingerprint)
+        end = records.tell()
+        if checksum is not None and end - hashed >= READ_BLOCK_SIZE:
+            checksum.update(records[hashed:end])
+            hashed = end
+        yield row_hash, start, end - start
+        start = end
+    if checksum is not None:
+        checksum.update(records[hashed:])
+
+
+def scan_rows(file_path, delimiter, fingerprint, checksum):
+    """
+    Read a file once, feeding every byte to the checksum.
+    Yields the header first, then the hash, byte offset and line length of each row.
+    Files without quoting are read as bytes from a memory map, lines are only split and decoded when they need it;
+    others go through csv.
+    """
+    if use_byte_tokenizer(file_path):
+        with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as records:
+            header_line = records.readline()
+            yield next(csv.reader([header_line.decode('utf-8')], delimiter=delimiter), None)  # Extract header
+            yield from scan_lines(records, records.tell(), delimiter, fingerprint, checksum)
+        return
+
+    file_reader = ChecksumReader(open(file_path, 'rb'), checksum)
+    with io.BufferedReader(file_reader, READ_BLOCK_SIZE) as file:
+        lines = LineReader(file)
+        reader = csv.reader(lines, delimiter=delimiter)
+        yield next(reader, None)  # Extract header
+        start = lines.position
+        for row in reader:
+            yield generate_row_hash(row, fingerprint), start, lines.position - start
+            start = lines.position
+        file_reader.drain()
+
+
+def row_record(fingerprint):
+    """
+    Return the record layout used to store rows on disk for a fingerprint.
+    """
+    return STRICT_ROW_RECORD if fingerprint == "sha256" else ROW_RECORD
+
+
+def read_row_records(path, record):
+    """
+    Read row records back from a file, in batches, in the order they were written.
+    """
+    with open(path, 'rb') as file:
+        while block := file.read(record.size * RECORD_BATCH):
+            yield from record.iter_unpack(block)
+
+
+def cache_entry_paths(cache_folder, file_path, fingerprint):
+    """
+    Return the manifest and row record paths of a file's cache entry.
+    """
+    name = hashlib.sha256(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+    return (os.path.join(cache_folder, f"{name}_{fingerprint}.json"),
+            os.path.join(cache_folder, f"{name}_{fingerprint}.rows"))
+
+
+def file_identity(file_path):
+    """
+    Return the size, modification time and inode that identify an unchanged file.
+    """
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "inode": stat.st_ino}
+
+
+def load_cache_entry(cache_folder, file_path, fingerprint):
+    """
+    Return the cached manifest of a file, or None when there is none or the file changed since it was cached.
+    """
+    manifest_path, rows_path = cache_entry_paths(cache_folder, file_path, fingerprint)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("identity") != file_identity(file_path) or not os.path.exists(rows_path):
+        return None
+    return manifest
+
+
+def cache_rows(rows_scanned, cache_folder, file_path, fingerprint, header, details):
+    """
+    Pass the scanned rows through while writing them to the file's cache entry.
+    The manifest is only written once every row has been read, so an interrupted run leaves no entry behind.
+    """
+    manifest_path, rows_path = cache_entry_paths(cache_folder, file_path, fingerprint)
+    identity = file_identity(file_path)
+    record = row_record(fingerprint)
+    with open(rows_path + ".tmp", 'wb') as rows_file:
+        for row in rows_scanned:
+            rows_file.write(record.pack(*row))
+            yield row
+    os.replace(rows_path + ".tmp", rows_path)
+    manifest = {"path": os.path.abspath(file_path), "identity": identity, "fingerprint": fingerprint,
+                "checksum": details["checksum"], "header": header}
+    with open(manifest_path + ".tmp", 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def open_rows(file_path, delimiter, fingerprint=DEFAULT_FINGERPRINT, cache_folder=None, parse_workers=1):
+    """
+    Open the rows of a file for comparison.
+    Returns the header, an iterator over the hash, line offset and line length of each row,
+    and a details dict whose checksum is set once every row has been read.
+    With a cache folder, an unchanged file is served from its cache entry without being read,
+    and any other file is cached while it is read. Large files hashed in byte ranges by several processes
+    (with parse_workers above 1) are read once by the workers and get no checksum.
+    """
+    details = {"checksum": None}
+    if cache_folder:
+        manifest = load_cache_entry(cache_folder, file_path, fingerprint)
+        if manifest:
+            details["checksum"] = manifest["checksum"]
+            rows_path = cache_entry_paths(cache_folder, file_path, fingerprint)[1]
+            return manifest["header"], read_row_records(rows_path, row_record(fingerprint)), details
+
+    if parse_workers > 1 and can_split_ranges(file_path):
+        checksum = None
+        rows_scanned = scan_row_ranges(file_path, delimiter, fingerprint, parse_workers)
+    else:
+        checksum = hashlib.sha256()
+        rows_scanned = scan_rows(file_path, delimiter, fingerprint, checksum)
+    header = next(rows_scanned)
+
+    def read_all():
+        yield from rows_scanned
+        details["checksum"] = checksum.hexdigest() if checksum else None
+
+    rows = read_all()
+    if cache_folder:
+        os.makedirs(cache_folder, exist_ok=True)
+        rows = cache_rows(rows, cache_folder, file_path, fingerprint, header, details)
+    return header, rows, details
+
+
+def index_rows(rows_scanned):
+    """
+    Index scanned rows by row hash: for each distinct hash, the byte offset and length of its line.
+    Later copies of a row are kept apart in the repeats, so the only-rows can be copied out exactly as they appear.
+    """
+    rows = {}
+    repeats = {}
+    for row_hash, offset, length in rows_scanned:
+        if row_hash in rows:
+            repeats.setdefault(row_hash, []).append((offset, length))
+        else:
+            rows[row_hash] = (offset, length)
+    return rows, repeats
+
+
+def index_row_arrays(rows_scanned):
+    """
+    Index scanned rows as flat arrays of 64-bit row fingerprints, line offsets and line lengths, in file order.
+    This takes 20 bytes per row instead of a Python object per row.
+    """
+    hashes = array('Q')
+    offsets = array('Q')
+    lengths = array('I')
+    for row_hash, offset, length in rows_scanned:
+        hashes.append(row_hash)
+        offsets.append(offset)
+        lengths.append(length)
+    return hashes, offsets, lengths
+
+
+def diff_row_dicts(pre_index, post_index, same_rows=None):
+    """
+    Difference two hash dict indexes with set operations on their keys.
+    Returns the distinct row counts, the distinct only-row counts and the line positions of the only-rows.
+    With a same_rows check (strict mode), rows whose hashes match are also compared by their line positions,
+    and rows that turn out to differ are only-rows on both sides.
+    """
+    pre_rows, pre_repeats = pre_index
+    post_rows, post_repeats = post_index
+    pre_only_hashes = pre_rows.keys() - post_rows.keys()
+    post_only_hashes = post_rows.keys() - pre_rows.keys()
+    if same_rows:
+        for row_hash in pre_rows.keys() & post_rows.keys():
+            if not same_rows(pre_rows[row_hash], post_rows[row_hash]):
+                pre_only_hashes.add(row_hash)
+                post_only_hashes.add(row_hash)
+
+    def only_positions(rows, repeats, only_hashes):
+        positions = [rows[row_hash] for row_hash in only_hashes]
+        for row_hash in only_hashes:
+            positions.extend(repeats.get(row_hash, ()))
+        positions.sort()
+        return positions
+
+    return (len(pre_rows), len(post_rows), len(pre_only_hashes), len(post_only_hashes),
+            only_positions(pre_rows, pre_repeats, pre_only_hashes),
+            only_positions(post_rows, post_repeats, post_only_hashes))
+
+
+def diff_row_arrays(pre_index, post_index):
+    """
+    Difference two fingerprint array indexes with sorted NumPy set operations.
+    Returns the same values as diff_row_dicts.
+    """
+    pre_hashes = np.frombuffer(pre_index[0], dtype=np.uint64)
+    post_hashes = np.frombuffer(post_index[0], dtype=np.uint64)
+    pre_unique = np.unique(pre_hashes)
+    post_unique = np.unique(post_hashes)
+    pre_only_hashes = np.setdiff1d(pre_unique, post_unique, assume_unique=True)
+    post_only_hashes = np.setdiff1d(post_unique, pre_unique, assume_unique=True)
+
+    def only_positions(index, row_hashes, only_hashes):
+        # Every row whose hash is only on this side, repeats included, in file order
+        selected = np.isin(row_hashes, only_hashes)
+        offsets = np.frombuffer(index[1], dtype=np.uint64)[selected]
+        lengths = np.frombuffer(index[2], dtype=np.uint32)[selected]
+        return zip(offsets.tolist(), lengths.tolist())
+
+    return (len(pre_unique), len(post_unique), len(pre_only_hashes), len(post_only_hashes),
+            only_positions(pre_index, pre_hashes, pre_only_hashes),
+            only_positions(post_index, post_hashes, post_only_hashes))
+
+
+def open_bucket_limit():
+    """
+    Return how many bucket files may be open at once: half the open-file limit, leaving room for the input files,
+    report files and worker pipes, or DEFAULT_OPEN_BUCKETS when the limit is unknown.
+    """
+    if resource is None:
+        return DEFAULT_OPEN_BUCKETS
+    soft_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    if soft_limit == resource.RLIM_INFINITY:
+        return DEFAULT_OPEN_BUCKETS
+    return max(soft_limit // 2, 2)
+
+
+def partition_rows(rows_scanned, bucket_folder, name, partitions, fingerprint=DEFAULT_FINGERPRINT):
+    """
+    Write scanned rows to on-disk buckets chosen by their row hash,
+    so a bucket only ever meets the same bucket of the other file.
+    The number of bucket files open at once is kept under the open-file limit (see split_buckets).
+    Returns the bucket file paths.
+    """
+    return split_buckets(rows_scanned, bucket_folder, name, partitions, 0, partitions, fingerprint, open_bucket_limit())
+
+
+def split_buckets(rows_scanned, bucket_folder, name, partitions, first, last, fingerprint, open_limit):
+    """
+    Write scanned rows to one bucket file per partition from first to last (exclusive).
+    With more partitions than files that may be open at once, the rows are first split into groups of
+    consecutive partitions, one file per group, and each group file is split again the same way.
+    Rows keep their file order in every bucket. Returns the bucket file paths in partition order.
+    """
+    record = row_record(fingerprint)
+    count = last - first
+    groups = count if count <= open_limit else min(open_limit, math.ceil(count / open_limit))
+    starts = [first + count * group // groups for group in range(groups)]
+    ends = starts[1:] + [last]
+    if groups == count:
+        paths = [os.path.join(bucket_folder, f"{name}_{bucket}.bin") for bucket in starts]
+    else:
+        paths = [os.path.join(bucket_folder, f"{name}_{start}-{end}.bin") for start, end in zip(starts, ends)]
+    bucket_files = []
+    try:
+        for path in paths:
+            bucket_files.append(open(path, 'wb'))
+        for row_hash, offset, length in rows_scanned:
+            bucket = (int.from_bytes(row_hash[:8], 'little') if fingerprint == "sha256" else row_hash) % partitions
+            bucket_files[bisect_right(starts, bucket) - 1].write(record.pack(row_hash, offset, length))
+    finally:
+        for bucket_file in bucket_files:
+            bucket_file.close()
+    if groups == count:
+        return paths
+    buckets = []
+    for path, start, end in zip(paths, starts, ends):
+        buckets.extend(split_buckets(read_row_records(path, record), bucket_folder, name, partitions, start, end,
+                                     fingerprint, open_limit))
+        os.remove(path)
+    return buckets
+
+
+def read_bucket(path, fingerprint=DEFAULT_FINGERPRINT):
+    """
+    Read the rows of one bucket file back, in file order.
+    """
+    return read_row_records(path, row_record(fingerprint))
+
+
+def write_positions(positions, path):
+    """
+    Write line positions, already in file order, to a position file.
+    """
+    with open(path, 'wb') as file:
+        for batch in iter(lambda: list(islice(positions, RECORD_BATCH)), []):
+            file.write(b''.join(POSITION_RECORD.pack(offset, length) for offset, length in batch))
+    return path
+
+
+def merge_positions(paths, bucket_folder, name, open_limit):
+    """
+    Merge position files, each in file order, into one stream of positions in file order.
+    With more files than may be open at once, groups of them are first merged into intermediate position files.
+    """
+    level = 0
+    while len(paths) > open_limit:
+        paths = [write_positions(heapq.merge(*(read_row_records(path, POSITION_RECORD)
+                                               for path in paths[start:start + open_limit])),
+                                 os.path.join(bucket_folder, f"{name}_merged_{level}_{start}.bin"))
+                 for start in range(0, len(paths), open_limit)]
+        level += 1
+    return heapq.merge(*(read_row_records(path, POSITION_RECORD) for path in paths))
+
+
+def diff_partitioned(pre_rows, post_rows, fingerprint, partitions, index_file, diff_rows, bucket_folder):
+    """
+    Difference two files whose row index does not fit in memory.
+    The scanned rows of both files are partitioned into on-disk buckets in the bucket folder and the bucket pairs
+    are differenced one at a time, so only one bucket pair is held in memory. The only-row positions of each bucket
+    are written to position files there too, and merged back into file order as they are read, so they are never
+    all held in memory either. Returns the same values as diff_row_dicts; the caller removes the bucket folder once
+    the positions have been read.
+    """
+    pre_buckets = partition_rows(pre_rows, bucket_folder, "pre", partitions, fingerprint)
+    post_buckets = partition_rows(post_rows, bucket_folder, "post", partitions, fingerprint)
+    totals = [0, 0, 0, 0]
+    pre_position_files = []
+    post_position_files = []
+    for bucket, (pre_bucket, post_bucket) in enumerate(zip(pre_buckets, post_buckets)):
+        *counts, pre_positions, post_positions = diff_rows(index_file(read_bucket(pre_bucket, fingerprint)),
+                                                           index_file(read_bucket(post_bucket, fingerprint)))
+        totals = [total + count for total, count in zip(totals, counts)]
+        pre_position_files.append(write_positions(iter(pre_positions),
+                                                  os.path.join(bucket_folder, f"pre_only_{bucket}.bin")))
+        post_position_files.append(write_positions(iter(post_positions),
+                                                   os.path.join(bucket_folder, f"post_only_{bucket}.bin")))
+        os.remove(pre_bucket)
+        os.remove(post_bucket)
+
+    open_limit = open_bucket_limit()
+    return (*totals, merge_positions(pre_position_files, bucket_folder, "pre_only", open_limit),
+            merge_positions(post_position_files, bucket_folder, "post_only", open_limit))
+
+
+def count_distinct_rows(rows_scanned, fingerprint, partitions, index_file):
+    """
+    Count the distinct row hashes of one file, bucket by bucket on disk when its index does not fit in memory.
+    """
+    def distinct(index):
+        if isinstance(index[0], dict):
+            return len(index[0])
+        return np.unique(np.frombuffer(index[0], dtype=np.uint64)).size
+
+    if partitions < 2:
+        return distinct(index_file(rows_scanned))
+    bucket_folder = tempfile.mkdtemp()
+    try:
+        buckets = partition_rows(rows_scanned, bucket_folder, "rows", partitions, fingerprint)
+        return sum(distinct(index_file(read_bucket(bucket, fingerprint))) for bucket in buckets)
+    finally:
+        shutil.rmtree(bucket_folder, ignore_errors=True)
+
+
+def identical_contents(pre_file, post_file):
+    """
+    Compare the contents of two files of the same size.
+    A few blocks spread over both files are compared first, so most changed files are told apart after reading
+    a little of each; then the files are compared block by block, stopping at the first difference.
+    Returns the checksum of the identical files, computed from the same reads, or None when they differ.
+    """
+    size = os.path.getsize(pre_file)
+    with open(pre_file, 'rb') as pre, open(post_file, 'rb') as post:
+        for sample in range(IDENTICAL_SAMPLE_BLOCKS):
+            offset = size * sample // IDENTICAL_SAMPLE_BLOCKS
+            pre.seek(offset)
+            post.seek(offset)
+            if pre.read(IDENTICAL_SAMPLE_SIZE) != post.read(IDENTICAL_SAMPLE_SIZE):
+                return None
+        pre.seek(0)
+        post.seek(0)
+        checksum = hashlib.sha256()
+        while block := pre.read(READ_BLOCK_SIZE):
+            if block != post.read(READ_BLOCK_SIZE):
+                return None
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def identical_files(pre_file, post_file, fingerprint=DEFAULT_FINGERPRINT, cache_folder=None):
+    """
+    Check whether two files are byte-identical: their sizes are compared first, then their cached checksums when
+    both files have a cache entry, and otherwise their contents, so files that differ are usually not read in full
+    before they are compared row by row. Returns the shared checksum, or None when the files differ.
+    """
+    if os.path.getsize(pre_file) != os.path.getsize(post_file):
+        return None
+    if get_file_delimiter(pre_file) != get_file_delimiter(post_file):
+        return None
+    if cache_folder:
+        pre_manifest = load_cache_entry(cache_folder, pre_file, fingerprint)
+        post_manifest = load_cache_entry(cache_folder, post_file, fingerprint)
+        if pre_manifest and post_manifest and pre_manifest["checksum"] and post_manifest["checksum"]:
+            return pre_manifest["checksum"] if pre_manifest["checksum"] == post_manifest["checksum"] else None
+    return identical_contents(pre_file, post_file)
+
+
+def read_row(file, position, delimiter):
+    """
+    Read the row at a line position of an open file, with its cells trimmed as they are for hashing.
+    """
+    offset, length = position
+    file.seek(offset)
+    text = file.read(length).decode('utf-8')
+    return [cell.strip() for cell in next(csv.reader(io.StringIO(text, newline=''), delimiter=delimiter), [])]
+
+
+def copy_rows(file_path, positions, output_file):
+    """
+    Copy the lines at the given byte positions, in file order, from a file to the output file.
+    """
+    with open(file_path, 'rb') as file:
+        for offset, length in positions:
+            file.seek(offset)
+            line = file.read(length).decode('utf-8').rstrip('\r\n')
+            output_file.write(line + "\n")
+
+
+def compare_large_files(pre_file, post_file, fingerprint=DEFAULT_FINGERPRINT, memory_limit=DEFAULT_MEMORY_LIMIT,
+                        cache_folder=None, parse_workers=1, strict=False):
     """
     Compare two large files by streaming through them line by line.
     Uses hash-based comparison for efficiency and stores intermediate results in temporary files.
+    Each file is parsed once; the only-rows are copied out by the byte offsets recorded while hashing.
+    With NumPy installed, 64-bit fingerprints are kept in compact arrays and differenced by sorting.
+    When the estimated row index is larger than the memory limit, the rows are partitioned on disk first.
+    With a cache folder, files unchanged since an earlier run reuse their cached checksum and row fingerprints.
+    Byte-identical files are detected from their size and checksum and only the pre file's rows are counted.
+    With more than one parse worker, large unquoted files are hashed in byte ranges by that many processes.
+    In strict mode rows with matching fingerprints are read back and compared cell by cell
+    before they count as matching.
     """
-    pre_hashes = set()
-    post_hashes = set()
-
     # Determine delimiters for the files
     pre_delimiter = get_file_delimiter(pre_file)
     post_delimiter = get_file_delimiter(post_file)
 
-    # Temporary files for storing unique rows
-    pre_only_file = tempfile.NamedTemporaryFile(delete=False, mode='w', newline='', encoding='utf-8')
-    post_only_file = tempfile.NamedTemporaryFile(delete=False, mode='w', newline='', encoding='utf-8')
-
-    # Read Pre File
-    with open(pre_file, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.reader(file, delimiter=pre_delimiter)
-        pre_header = next(reader, None)  # Extract header
-        for row in reader:
-            row_hash = generate_row_hash(row)
-            pre_hashes.add(row_hash)
-
-    # Read Post File
-    with open(post_file, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.reader(file, delimiter=post_delimiter)
-        post_header = next(reader, None)  # Extract header
-        for row in reader:
-            row_hash = generate_row_hash(row)
-            post_hashes.add(row_hash)
+    if np is not None and fingerprint != "sha256":
+        index_file, diff_rows, row_size = index_row_arrays, diff_row_arrays, ARRAY_INDEX_ROW_SIZE
+    else:
+        index_file, diff_rows, row_size = index_rows, diff_row_dicts, DICT_INDEX_ROW_SIZE
+    index_size = (estimate_rows(pre_file) + estimate_rows(post_file)) * row_size
+    partitions = index_size // parse_size(memory_limit) + 1
 
-    # Compare and write results to temp files
-    pre_only_hashes = pre_hashes - post_hashes
-    post_only_hashes = post_hashes - pre_hashes
+    checksum = identical_files(pre_file, post_file, fingerprint, cache_folder)
+    if checksum:
+        # Both files hold the same rows, a single counting pass gives the complete match summary
+        header, rows, details = open_rows(pre_file, pre_delimiter, fingerprint, cache_folder, parse_workers)
+        total_rows = count_distinct_rows(rows, fingerprint, partitions, index_file)
+        pre_only_file = tempfile.NamedTemporaryFile(delete=False)
+        pre_only_file.close()
+        post_only_file = tempfile.NamedTemporaryFile(delete=False)
+        post_only_file.close()
+        return {
+            "pre_header": header,
+            "post_header": header,
+            "total_pre_rows": total_rows,
+            "total_post_rows": total_rows,
+            "matching_rows": total_rows,
+            "total_different_rows": 0,
+            "pre_only_file": pre_only_file.name,
+            "post_only_file": post_only_file.name,
+            "no_differences": True,
+            "pre_file_checksum": checksum,
+            "post_file_checksum": checksum
+        }
 
-    # Write pre-only rows to temp file
-    with open(pre_file, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.reader(file, delimiter=',')
-        next(reader, None)  # Skip header
-        for row in reader:
-            if generate_row_hash(row) in pre_only_hashes:
-                pre_only_file.write(pre_delimiter.join(row) + "\n")
+    # Read both files, computing their checksums from the same bytes
+    pre_header, pre_rows, pre_details = open_rows(pre_file, pre_delimiter, fingerprint, cache_folder, parse_workers)
+    post_header, post_rows, post_details = open_rows(post_file, post_delimiter, fingerprint, cache_folder, parse_workers)
 
-    # Write post-only rows to temp file
-    with open(post_file, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.reader(file, delimiter=',')
-        next(reader, None)  # Skip header
-        for row in reader:
-            if generate_row_hash(row) in post_only_hashes:
-                post_only_file.write(post_delimiter.join(row) + "\n")
+    # Compare the row hashes
+    bucket_folder = tempfile.mkdtemp() if partitions > 1 else None
+    try:
+        with ExitStack() as stack:
+            if strict:
+                # Rows with matching fingerprints are read back from both files and compared
+                pre_lines = stack.enter_context(open(pre_file, 'rb'))
+                post_lines = stack.enter_context(open(post_file, 'rb'))
+                diff_rows = partial(diff_row_dicts, same_rows=lambda pre_position, post_position:
+                                    read_row(pre_lines, pre_position, pre_delimiter) ==
+                                    read_row(post_lines, post_position, post_delimiter))
+            if bucket_folder:
+                (total_pre_rows, total_post_rows, pre_only_rows, post_only_rows,
+                 pre_only_positions, post_only_positions) = diff_partitioned(pre_rows, post_rows, fingerprint, partitions,
+                                                                             index_file, diff_rows, bucket_folder)
+            else:
+                (total_pre_rows, total_post_rows, pre_only_rows, post_only_rows,
+                 pre_only_positions, post_only_positions) = diff_rows(index_file(pre_rows), index_file(post_rows))
 
-    pre_only_file.close()
-    post_only_file.close()
+        # Temporary files for storing unique rows
+        with tempfile.NamedTemporaryFile(delete=False, mode='w', newline='', encoding='utf-8') as pre_only_file:
+            copy_rows(pre_file, pre_only_positions, pre_only_file)
+        with tempfile.NamedTemporaryFile(delete=False, mode='w', newline='', encoding='utf-8') as post_only_file:
+            copy_rows(post_file, post_only_positions, post_only_file)
+    finally:
+        if bucket_folder:
+            shutil.rmtree(bucket_folder, ignore_errors=True)
 
     return {
         "pre_header": pre_header,
         "post_header": post_header,
-        "total_pre_rows": len(pre_hashes),
-        "total_post_rows": len(post_hashes),
-        "matching_rows": len(pre_hashes & post_hashes),
-        "total_different_rows": len(pre_only_hashes) + len(post_only_hashes),
+        "total_pre_rows": total_pre_rows,
+        "total_post_rows": total_post_rows,
+        "matching_rows": total_pre_rows - pre_only_rows,
+        "total_different_rows": pre_only_rows + post_only_rows,
         "pre_only_file": pre_only_file.name,
         "post_only_file": post_only_file.name,
-        "no_differences": len(pre_only_hashes) == 0 and len(post_only_hashes) == 0
+        "no_differences": pre_only_rows == 0 and post_only_rows == 0,
+        "pre_file_checksum": pre_details["checksum"] or "N/A",
+        "post_file_checksum": post_details["checksum"] or "N/A"
     }
 
+def compare_file_pair(file_name, pre_folder, post_folder, output_folder, timestamp, fingerprint=DEFAULT_FINGERPRINT,
+                      memory_limit=DEFAULT_MEMORY_LIMIT, cache_folder=None, parse_workers=1, outputs=(), html=True,
+                      strict=False):
+    """
+    Compare one file that exists in both folders and write its HTML report, and its only-rows in each output format.
+    Returns the paths written and whether the comparison succeeded.
+    """
+    pre_file_path = os.path.join(pre_folder, file_name)
+    post_file_path = os.path.join(post_folder, file_name)
+    output_name = f"FolderComp_{os.path.splitext(file_name)[0].replace(os.sep, '_')}_{timestamp}"
+    output_paths = []
+
+    try:
+        start_time = datetime.now()
+
+        # Capture Execution Details
+        execution_details = {
+            "executor_name": os.getlogin(),
+            "start_time": start_time.strftime('%Y-%m-%d %H:%M:%S'),
+            "pre_file_checksum": "N/A",
+            "post_file_checksum": "N/A",
+            "mac_address": get_mac_address(),
+        }
+
+        # Perform File Comparison, the checksums are computed while the files are read
+        result = compare_large_files(pre_file_path, post_file_path, fingerprint, memory_limit, cache_folder,
+                                     parse_workers, strict)
+        execution_details["pre_file_checksum"] = result["pre_file_checksum"]
+        execution_details["post_file_checksum"] = result["post_file_checksum"]
+        error_message = None
+        end_time = datetime.now()
+        execution_details["end_time"] = end_time.strftime('%Y-%m-%d %H:%M:%S')
+        execution_details["time_taken"] = str(end_time - start_time)
+
+        # Capture Screenshot
+        # screenshot_path = capture_screenshot(output_folder, file_name)
+
+        # Stream the only-rows to the machine-readable outputs
+        output_paths = write_outputs(result, outputs, os.path.join(output_folder, output_name)) if outputs else []
+        succeeded = True
+
+    except Exception as e:
+        result = {}
+        error_message = f"An error occurred: {str(e)}"
+        execution_details["end_time"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        execution_details["time_taken"] = "N/A"
+        # screenshot_path = None
+
+        # Mark comparison as failed for this file
+        succeeded = False
+
+    # Generate HTML Report for the File
+    if html:
+        output_file_path = os.path.join(output_folder, f"{output_name}.html")
+        write_html_report(file_name, pre_file_path, post_file_path, result, execution_details, output_file_path, error_message)
+        output_paths.append(output_file_path)
+    elif error_message:
+        print(f"Comparison of {file_name} failed. {error_message}")
+
+    return output_paths, succeeded
+
+
+def sketch_rows(rows_scanned, size=ESTIMATE_SAMPLE_SIZE):
+    """
+    Sample the distinct rows with the smallest fingerprints (a bottom-k sample), in fixed memory whatever the file size.
+    SHA-256 fingerprints are sampled by their first 8 bytes. Returns the sampled values and the number of rows.
+    """
+    heap = []  # Negated sampled values, so the largest is on top
+    sample = set()
+    rows = 0
+    for row_hash, offset, length in rows_scanned:
+        rows += 1
+        value = row_hash if isinstance(row_hash, int) else int.from_bytes(row_hash[:8], 'little')
+        if value in sample:
+            continue
+        if len(heap) < size:
+            heapq.heappush(heap, -value)
+        elif value < -heap[0]:
+            sample.discard(-heapq.heapreplace(heap, -value))
+        else:
+            continue
+        sample.add(value)
+    return sample, rows
+
+
+def estimate_from_samples(pre_sample, post_sample, size=ESTIMATE_SAMPLE_SIZE):
+    """
+    Estimate how the distinct rows of two files compare from their samples.
+    The smallest values of the union of both samples are a uniform sample of all distinct rows; the share of each
+    category is scaled by the estimated number of distinct rows (k - 1) / h_k, h_k being the k-th smallest value as
+    a fraction of the hash range. Returns (estimate, bound) per category, the bound being about two standard
+    deviations (95%); when every row fits in the samples the counts are exact.
+    """
+    union = heapq.nsmallest(size, pre_sample | post_sample)
+    counts = dict.fromkeys(ESTIMATE_CATEGORIES, 0)
+    for value in union:
+        if value not in post_sample:
+            counts["pre_only"] += 1
+        elif value not in pre_sample:
+            counts["post_only"] += 1
+        else:
+            counts["matching"] += 1
+    if len(union) < size:
+        return {category: (count, 0) for category, count in counts.items()}
+    distinct_rows = (size - 1) / ((union[-1] + 1) / 2 ** 64)
+    estimates = {}
+    for category, count in counts.items():
+        share = count / size
+        deviation = distinct_rows * math.sqrt(share * (1 - share) / size + share * share / (size - 2))
+        estimates[category] = (round(share * distinct_rows), math.ceil(1.96 * deviation))
+    return estimates
+
+
+def estimate_file_pair(file_name, pre_folder, post_folder, fingerprint=DEFAULT_FINGERPRINT, cache_folder=None,
+                       parse_workers=1):
+    """
+    Estimate the comparison of one file that exists in both folders from one pass over each file, in fixed memory.
+    Files unchanged since they were cached are sampled from their cached fingerprints.
+    Returns a description of the estimate, or of the error that stopped it.
+    """
+    try:
+        samples = []
+        for folder in (pre_folder, post_folder):
+            file_path = os.path.join(folder, file_name)
+            header, rows, details = open_rows(file_path, get_file_delimiter(file_path), fingerprint, cache_folder,
+                                              parse_workers)
+            samples.append(sketch_rows(rows))
+        (pre_sample, pre_rows), (post_sample, post_rows) = samples
+        matching, pre_only, post_only = (estimate_from_samples(pre_sample, post_sample)[category]
+                                         for category in ESTIMATE_CATEGORIES)
+    except Exception as e:
+        return f"{file_name}: estimate failed. An error occurred: {str(e)}"
+    return (f"{file_name}: {pre_rows} pre rows, {post_rows} post rows; distinct rows matching ~{matching[0]} "
+            f"(+/- {matching[1]}), only in pre ~{pre_only[0]} (+/- {pre_only[1]}), "
+            f"only in post ~{post_only[0]} (+/- {post_only[1]})")
+
+
+def largest_first(file_names, pre_files, post_files):
+    """
+    Order files by their combined pre and post size, largest first, so the longest comparisons start early.
+    The sizes come from the folder listings.
+    """
+    return sorted(file_names, key=lambda file_name: pre_files[file_name] + post_files[file_name], reverse=True)
+
+
 # Update the compare_folders function to include the overall summary generation
-def compare_folders(pre_folder, post_folder, output_folder):
+def compare_folders(pre_folder, post_folder, output_folder, fingerprint=DEFAULT_FINGERPRINT, strict=False,
+                    workers=DEFAULT_WORKERS, memory_limit=DEFAULT_MEMORY_LIMIT, cache_folder=None, include=None, exclude=None,
+                    outputs=None, html=True, estimate=False):
     """
     Compare all common files in two folders and generate an HTML report for each.
     At the end, generate an overall summary of the comparison.
+    Strict mode fingerprints rows with SHA-256 instead of a 64-bit hash, and rechecks rows whose fingerprints match.
+    With more than one worker the files are compared in a process pool, largest files first;
+    workers left over when there are fewer files than workers parse large files in byte ranges.
+    A cache folder keeps each file's checksum and row fingerprints between runs.
+    Both folders are walked recursively; files in subfolders are matched by their relative path,
+    and only files passing the include and exclude globs are considered.
+    The only-rows of each file can also be written as JSON Lines, CSV or Parquet, and the HTML reports turned off.
+    The estimate mode only prints approximate counts for each file, from a fixed-size sample of its rows.
     """
-    pre_files = {f for f in os.listdir(pre_folder) if os.path.isfile(os.path.join(pre_folder, f))}
-    post_files = {f for f in os.listdir(post_folder) if os.path.isfile(os.path.join(post_folder, f))}
+    if strict:
+        fingerprint = "sha256"
+    check_fingerprint(fingerprint)
+    parse_size(memory_limit)
+    outputs = outputs or []
+    check_outputs(outputs)
 
-    common_files = pre_files & post_files
+    pre_files = list_files(pre_folder, include, exclude, workers)
+    post_files = list_files(post_folder, include, exclude, workers)
+
+    common_files = largest_first(pre_files.keys() & post_files.keys(), pre_files, post_files)
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     comparison_results = {}
+    parse_workers = max(1, workers // max(len(common_files), 1))
 
-    for file_name in common_files:
-        pre_file_path = os.path.join(pre_folder, file_name)
-        post_file_path = os.path.join(post_folder, file_name)
-
-        try:
-            start_time = datetime.now()
-
-            # Capture Execution Details
-            execution_details = {
-                "executor_name": os.getlogin(),
-                "start_time": start_time.strftime('%Y-%m-%d %H:%M:%S'),
-                "pre_file_checksum": compute_checksum(pre_file_path),
-                "post_file_checksum": compute_checksum(post_file_path),
-                "mac_address": get_mac_address(),
-            }
-
-            # Perform File Comparison
-            result = compare_large_files(pre_file_path, post_file_path)
-            error_message = None
-            end_time = datetime.now()
-            execution_details["end_time"] = end_time.strftime('%Y-%m-%d %H:%M:%S')
-            execution_details["time_taken"] = str(end_time - start_time)
-
-            # Capture Screenshot
-            # screenshot_path = capture_screenshot(output_folder, file_name)
-
-            # Store result for overall summary
-            comparison_results[file_name] = True
-
-        except Exception as e:
-            result = {}
-            error_message = f"An error occurred: {str(e)}"
-            execution_details["end_time"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            execution_details["time_taken"] = "N/A"
-            # screenshot_path = None
-
-            # Mark comparison as failed for this file
-            comparison_results[file_name] = False
-
-        # Generate HTML Report for the File
-        output_file_name = f"FolderComp_{os.path.splitext(os.path.basename(file_name))[0]}_{timestamp}.html"
-        output_file_path = os.path.join(output_folder, output_file_name)
-        write_html_report(file_name, pre_file_path, post_file_path, result, execution_details, output_file_path, error_message)
+    if estimate:
+        if workers < 2 or len(common_files) < 2:
+            for file_name in common_files:
+                print(estimate_file_pair(file_name, pre_folder, post_folder, fingerprint, cache_folder, parse_workers))
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(common_files))) as executor:
+                futures = [executor.submit(estimate_file_pair, file_name, pre_folder, post_folder, fingerprint,
+                                           cache_folder, parse_workers) for file_name in common_files]
+                for future in as_completed(futures):
+                    print(future.result())
+        return
 
-        print(f"Comparison result written to: {output_file_path}")
+    if workers < 2 or len(common_files) < 2:
+        for file_name in common_files:
+            output_paths, comparison_results[file_name] = compare_file_pair(
+                file_name, pre_folder, post_folder, output_folder, timestamp, fingerprint, memory_limit, cache_folder,
+                parse_workers, outputs, html, strict)
+            for output_path in output_paths:
+                print(f"Comparison result written to: {output_path}")
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(common_files))) as executor:
+            futures = {executor.submit(compare_file_pair, file_name, pre_folder, post_folder, output_folder, timestamp,
+                                       fingerprint, memory_limit, cache_folder, parse_workers, outputs, html,
+                                       strict): file_name
+                       for file_name in common_files}
+            for future in as_completed(futures):
+                output_paths, comparison_results[futures[future]] = future.result()
+                for output_path in output_paths:
+                    print(f"Comparison result written to: {output_path}")
 
     # Generate Overall Summary Report
-    generate_overall_summary(pre_folder, post_folder, output_folder, comparison_results)
+    if html:
+        generate_overall_summary(pre_folder, post_folder, output_folder, comparison_results, pre_files, post_files)
+    else:
+        print(f"Compared {len(common_files)} common files, {sum(comparison_results.values())} succeeded; "
+              f"{len(pre_files.keys() - post_files.keys())} files only in pre, "
+              f"{len(post_files.keys() - pre_files.keys())} files only in post")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("Usage: python compare_folders.py <pre_folder> <post_folder> <output_folder>")
-        sys.exit(1)
-
-    pre_folder = sys.argv[1]
-    post_folder = sys.argv[2]
-    output_folder = sys.argv[3]
+    parser = argparse.ArgumentParser(description="Compare the common files of two folders and generate HTML reports.")
+    parser.add_argument("pre_folder", help="Path to the pre folder")
+    parser.add_argument("post_folder", help="Path to the post folder")
+    parser.add_argument("output_folder", help="Path to the output folder")
+    parser.add_argument("--fingerprint", choices=FINGERPRINTS, default=DEFAULT_FINGERPRINT,
+                        help="Row fingerprint used to compare rows: 8-byte blake2b, xxh64 (needs the xxhash package) "
+                             f"or sha256 (default: {DEFAULT_FINGERPRINT})")
+    parser.add_argument("--strict", action="store_true",
+                        help="Use SHA-256 row fingerprints and recheck the full row whenever two fingerprints match")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Number of files compared at the same time (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--memory-limit", default=DEFAULT_MEMORY_LIMIT,
+                        help="Memory each file comparison may use for its row index before the rows are partitioned "
+                             f"on disk, e.g. 512M or 2G (default: {DEFAULT_MEMORY_LIMIT})")
+    parser.add_argument("--cache-folder",
+                        help="Folder keeping each file's checksum and row fingerprints, so files unchanged since "
+                             "an earlier run are not read again")
+    parser.add_argument("--include", action="append",
+                        help="Only compare files matching this glob, e.g. '*.csv' or 'sales/*' (can be repeated)")
+    parser.add_argument("--exclude", action="append",
+                        help="Skip files matching this glob (can be repeated)")
+    parser.add_argument("--output", action="append", choices=OUTPUT_FORMATS,
+                        help="Also write each file's only-rows to a machine-readable file in the output folder: "
+                             "jsonl, csv or parquet (needs pyarrow); can be repeated")
+    parser.add_argument("--no-html", action="store_true",
+                        help="Do not write the HTML reports, e.g. for batch runs that only need --output files")
+    parser.add_argument("--estimate", action="store_true",
+                        help="Only print the approximate numbers of matching, pre-only and post-only rows of each file, "
+                             "from a fixed-size sample of its rows with 95%% error bounds, without writing reports")
+    args = parser.parse_args()
 
-    compare_folders(pre_folder, post_folder, output_folder)
+    compare_folders(args.pre_folder, args.post_folder, args.output_folder, args.fingerprint, args.strict, args.workers,
+                    args.memory_limit, args.cache_folder, args.include, args.exclude, args.output, not args.no_html,
+                    args.estimate)
@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import FileCompare  # noqa: E402
+
+pytest.importorskip("numpy")
+
+
+def quiet(*args):
+    pass
+
+
+def write_csv(path, rows):
+    path.write_text("".join(",".join(row) + "\n" for row in rows), encoding="utf-8")
+    return str(path)
+
+
+def compare_columnar(pre_file, post_file):
+    result, pre_checksum, post_checksum = FileCompare.compare_files_columnar(pre_file, post_file, [0], log=quiet)
+    FileCompare.remove_spill_files(result)
+    return result
+
+
+def test_column_widths_differ_between_files(tmp_path):
+    # The widest value of column b is 5 bytes in pre and 22 in post, so the columns have different widths
+    pre_file = write_csv(tmp_path / "pre.csv", [["id", "a", "b"], ["1", "x", "hello"], ["2", "y", "z"]])
+    post_file = write_csv(tmp_path / "post.csv", [["id", "a", "b"], ["1", "x", "hello"],
+                                                  ["2", "y", "averyveryverylongvalue"]])
+    result = compare_columnar(pre_file, post_file)
+    assert result["fully_matching_rows"] == 1
+    assert result["total_differences"] == 1
+
+
+def test_whitespace_only_differences_count_as_matching(tmp_path):
+    pre_file = write_csv(tmp_path / "pre.csv", [["id", "a"], ["1", "x"], ["2", "y"]])
+    post_file = write_csv(tmp_path / "post.csv", [["id", "a"], ["1", " x "], ["2", "z"]])
+    result = compare_columnar(pre_file, post_file)
+    assert result["fully_matching_rows"] == 1
+    assert result["total_differences"] == 1
+
+
+def test_duplicate_keys_pair_in_file_order(tmp_path):
+    duplicated = write_csv(tmp_path / "duplicated.csv", [["id", "a"], ["1", "x"], ["1", "y"], ["2", "z"]])
+    single = write_csv(tmp_path / "single.csv", [["id", "a"], ["1", "x"], ["2", "z"]])
+    result = compare_columnar(single, duplicated)
+    assert (result["fully_matching_rows"], result["total_differences"], result["post_only_rows"]) == (2, 0, 1)
+    result = compare_columnar(duplicated, single)
+    assert (result["fully_matching_rows"], result["total_differences"], result["pre_only_rows"]) == (2, 0, 1)
@@ -0,0 +1,99 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import FileCompare  # noqa: E402
+
+SUMMARY_FIELDS = ("total_pre_rows", "total_post_rows", "fully_matching_rows", "total_differences", "pre_only_rows",
+                  "post_only_rows")
+
+
+def quiet(*args):
+    pass
+
+
+def write_csv(path, rows):
+    path.write_text("".join(",".join(row) + "\n" for row in rows), encoding="utf-8")
+    return str(path)
+
+
+def summary(result):
+    FileCompare.remove_spill_files(result)
+    return {field: result[field] for field in SUMMARY_FIELDS}
+
+
+def compare_sorted(pre_file, post_file):
+    pre_sorted, post_sorted = FileCompare.sort_files_to_temp(pre_file, post_file, [0], jobs=1, log=quiet)
+    try:
+        return summary(FileCompare.compare_sorted_files(pre_sorted, post_sorted, [0], log=quiet))
+    finally:
+        os.unlink(pre_sorted["path"])
+        os.unlink(post_sorted["path"])
+
+
+def compare_partitioned(pre_file, post_file):
+    result, pre_checksum, post_checksum = FileCompare.compare_files_partitioned(pre_file, post_file, [0], partitions=3,
+                                                                                jobs=1, log=quiet)
+    return summary(result)
+
+
+def test_hash_engine_pairs_duplicate_keys_like_sort_engine(tmp_path):
+    duplicated = write_csv(tmp_path / "duplicated.csv", [["id", "a"], ["1", "x"], ["1", "y"], ["2", "z"]])
+    single = write_csv(tmp_path / "single.csv", [["id", "a"], ["1", "x"], ["2", "z"]])
+    for pre_file, post_file in ((duplicated, single), (single, duplicated)):
+        expected = compare_sorted(pre_file, post_file)
+        assert expected["fully_matching_rows"] == 2
+        assert compare_partitioned(pre_file, post_file) == expected
+
+
+def test_write_buckets_splits_in_groups_under_the_open_file_limit(tmp_path):
+    records = [FileCompare.encode_record(str(i).encode(), [str(i).encode(), b"v" * (i % 7)], b"12345678")
+               for i in range(2000)]
+    buckets = FileCompare.write_buckets(iter(records), 50, 0, 50, 3)
+    try:
+        for partition, bucket in enumerate(buckets):
+            with open(bucket, "rb") as bucket_file:
+                assert bucket_file.read() == b"".join(record for key, record in records
+                                                      if FileCompare.partition_of(key, 50) == partition)
+    finally:
+        for bucket in buckets:
+            os.unlink(bucket)
+
+
+def test_presorted_numeric_key_order_matches_sort_engine(tmp_path):
+    header = [["id", "a"]]
+    pre_file = write_csv(tmp_path / "pre.csv", header + [[str(i), "x"] for i in (1, 2, 9, 10, 11)])
+    post_file = write_csv(tmp_path / "post.csv", header + [[str(i), "y" if i == 10 else "x"] for i in (2, 9, 10, 12)])
+    with pytest.raises(FileCompare.UnsortedInputError):
+        FileCompare.compare_presorted_files(pre_file, post_file, [0], log=quiet)
+    result, pre_checksum, post_checksum = FileCompare.compare_presorted_files(pre_file, post_file, [0], log=quiet,
+                                                                              key_order="numeric")
+    assert summary(result) == compare_sorted(pre_file, post_file)
+
+
+def test_presorted_numeric_key_order_keeps_equal_numerals_apart(tmp_path):
+    header = [["id", "a"]]
+    pre_file = write_csv(tmp_path / "pre.csv", header + [["01", "a"], ["1", "b"], ["1.0", "c"], ["10", "d"], ["1_0", "e"]])
+    post_file = write_csv(tmp_path / "post.csv", header + [["1", "b"], ["1.0", "c"], ["2", "x"], ["1_0", "z"]])
+    expected = compare_sorted(pre_file, post_file)
+    assert (expected["fully_matching_rows"], expected["total_differences"], expected["pre_only_rows"],
+            expected["post_only_rows"]) == (2, 1, 2, 1)
+    result, pre_checksum, post_checksum = FileCompare.compare_presorted_files(pre_file, post_file, [0], log=quiet,
+                                                                              key_order="numeric")
+    assert summary(result) == expected
+
+
+def test_compare_partition_creates_spill_files_only_for_its_results(tmp_path):
+    pre_bucket = tmp_path / "pre.bucket"
+    post_bucket = tmp_path / "post.bucket"
+    pre_bucket.write_bytes(FileCompare.encode_record(b"1", [b"1", b"x"], b"12345678")[1])
+    post_bucket.write_bytes(b"")
+    result = FileCompare.compare_partition(str(pre_bucket), str(post_bucket), [0])
+    try:
+        assert (result["differences_file"], result["post_only_file"], result["matching_file"]) == (None, None, None)
+        assert list(FileCompare.read_spill(result["pre_only_file"])) == [["1", ["1", "x"]]]
+    finally:
+        FileCompare.remove_spill_files(result)
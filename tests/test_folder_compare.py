@@ -0,0 +1,36 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import FolderCompare  # noqa: E402
+
+
+def test_split_buckets_splits_in_groups_under_the_open_file_limit(tmp_path):
+    rows = [(i * 2654435761 % 2 ** 64, i * 10, 10) for i in range(2000)]
+    buckets = FolderCompare.split_buckets(iter(rows), str(tmp_path), "rows", 50, 0, 50, "blake2b", 3)
+    assert len(buckets) == 50
+    for partition, bucket in enumerate(buckets):
+        assert list(FolderCompare.read_bucket(bucket)) == [row for row in rows if row[0] % 50 == partition]
+    # The group files are removed once they are split
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(bucket) for bucket in buckets)
+
+
+def test_merge_positions_merges_in_passes_under_the_open_file_limit(tmp_path):
+    positions = [(offset * 7, 7) for offset in range(1000)]
+    paths = [FolderCompare.write_positions(iter(positions[bucket::10]), str(tmp_path / f"positions_{bucket}.bin"))
+             for bucket in range(10)]
+    assert list(FolderCompare.merge_positions(paths, str(tmp_path), "positions", 3)) == positions
+
+
+def test_strict_mode_rechecks_rows_with_matching_fingerprints(tmp_path):
+    # Cells are joined by | before hashing, so these two different rows have the same fingerprint
+    pre_file = tmp_path / "pre.csv"
+    post_file = tmp_path / "post.csv"
+    pre_file.write_text('id,a\n1,x\n"a|b",c\n', encoding="utf-8")
+    post_file.write_text('id,a\n1,x\na,"b|c"\n', encoding="utf-8")
+    for strict, different_rows in ((False, 0), (True, 2)):
+        result = FolderCompare.compare_large_files(str(pre_file), str(post_file), "sha256", strict=strict)
+        os.unlink(result["pre_only_file"])
+        os.unlink(result["post_only_file"])
+        assert result["total_different_rows"] == different_rows
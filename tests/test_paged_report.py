@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import FileCompare  # noqa: E402
+
+# Runs the script of a paged report page against a minimal DOM: scrolls the pre_only section to its end, then looks
+# up a few keys, and prints the spacer height and the keys of the rows drawn after each step
+PAGE_RUNNER = r"""
+const fs = require("fs"), path = require("path");
+const [htmlPath, keys] = [process.argv[1], JSON.parse(process.argv[2])];
+const html = fs.readFileSync(htmlPath, "utf8");
+const elements = {};
+const element = id => elements[id] || (elements[id] = {
+  style: {}, innerHTML: "", textContent: "", scrollTop: 0, clientHeight: 600, clientWidth: 900, listeners: {},
+  addEventListener(type, listener) { this.listeners[type] = listener; },
+  querySelector(selector) { return element(id + " " + selector); },
+});
+global.requestAnimationFrame = callback => setTimeout(callback, 0);
+global.document = {
+  getElementById: element,
+  createElement: () => ({remove() {}}),
+  head: {appendChild: script => setTimeout(() => {
+    eval(fs.readFileSync(path.join(path.dirname(htmlPath), decodeURIComponent(script.src)), "utf8"));
+    script.onload();
+  }, 0)},
+};
+eval(html.slice(html.lastIndexOf("<script>") + 8, html.lastIndexOf("</script>")));
+const settle = () => new Promise(resolve => setTimeout(resolve, 100));
+const viewport = element("pre_only_viewport");
+const drawnKeys = () => [...viewport.querySelector("tbody").innerHTML.matchAll(/<tr[^>]*><td>([^<]*)</g)].map(m => m[1]);
+(async () => {
+  const output = {spacer: viewport.querySelector(".spacer").style.height, steps: []};
+  await settle();
+  viewport.scrollTop = parseFloat(output.spacer) - viewport.clientHeight;
+  viewport.listeners.scroll();
+  await settle();
+  output.steps.push(drawnKeys());
+  for (const key of keys) {
+    const search = element("pre_only_search");
+    await search.listeners.submit({preventDefault() {}, target: {elements: {key: {value: key}}}});
+    await settle();
+    output.steps.push(drawnKeys());
+  }
+  console.log(JSON.stringify(output));
+})();
+"""
+
+
+def quiet(*args):
+    pass
+
+
+def write_csv(path, rows):
+    path.write_text("".join(",".join(row) + "\n" for row in rows), encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node to run the report script")
+def test_paged_section_taller_than_the_maximum_height(tmp_path, monkeypatch):
+    # 2000 rows of 32 pixels are 64000 pixels, far above a maximum height of 100 rows
+    monkeypatch.setattr(FileCompare, "PAGED_REPORT_MAX_HEIGHT", 100 * FileCompare.PAGED_REPORT_ROW_HEIGHT)
+    keys = [f"{row:05d}" for row in range(2000)]
+    pre_file = write_csv(tmp_path / "pre.csv", [["id", "value"]] + [[key, "x"] for key in keys])
+    post_file = write_csv(tmp_path / "post.csv", [["id", "value"], ["99999", "x"]])
+    pre_sorted, post_sorted = FileCompare.sort_files_to_temp(pre_file, post_file, [0], jobs=1, log=quiet)
+    try:
+        result = FileCompare.compare_sorted_files(pre_sorted, post_sorted, [0], log=quiet)
+    finally:
+        os.unlink(pre_sorted["path"])
+        os.unlink(post_sorted["path"])
+    execution_details = dict.fromkeys(("executor_name", "start_time", "end_time", "time_taken", "pre_file_checksum",
+                                       "post_file_checksum", "mac_address"), "")
+    report_file = str(tmp_path / "report.html")
+    try:
+        FileCompare.generate_paged_report(pre_file, post_file, result, report_file, execution_details)
+    finally:
+        FileCompare.remove_spill_files(result)
+
+    searched = ["01000", "01990", "00007"]
+    output = json.loads(subprocess.run(["node", "-e", PAGE_RUNNER, report_file, json.dumps(searched)],
+                                       capture_output=True, text=True, check=True).stdout)
+    assert output["spacer"] == f"{FileCompare.PAGED_REPORT_MAX_HEIGHT}px"
+    # Scrolled to the end, the last rows are drawn
+    assert output["steps"][0][-1] == keys[-1]
+    # Each key found is drawn first, whatever the scroll position it maps to
+    assert [drawn[0] for drawn in output["steps"][1:]] == searched